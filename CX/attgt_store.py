@@ -0,0 +1,323 @@
+"""
+File: attgt_store.py
+Purpose: Persistent ATT(g,t) results from which every csdid aggregation is derived without refitting
+
+An ATTgtStore keeps what aggte() needs from a fitted csdid ATTgt: the
+group-time estimates, each unit's cohort and weight (for the cohort shares
+P(G = g) and their estimation effect) and the n x cells influence-function
+matrix, optionally as float32. save() writes it to a directory (the matrix as
+a plain .npy file) and load() memory-maps it back in a later session.
+
+Every aggregated parameter of csdid (simple, group, dynamic, calendar, any
+event window or balance_e) is a linear combination of the ATT(g,t), so its
+influence function is inffunc @ W plus the effect of the estimated cohort
+shares. That second term, csdid's wif(...) @ att, only depends on a unit's
+cohort: it reduces to w_i h[G_i] for a vector h over cohorts, so no n x cells
+matrix is built per parameter. All parameters of one aggregation (and its
+overall ATT) come from a single blocked pass over the stored matrix, and
+their bootstrap from one multiplier_bootstrap call (mboot_engine).
+
+Point estimates and analytical SEs match csdid's aggte(); bootstrap SEs and
+uniform bands use mboot_engine's draws, so they agree in distribution.
+
+Usage:
+    from attgt_store import ATTgtStore
+    store = ATTgtStore.from_csdid(ATTgt(...).fit(est_method="dr"))
+    store.save("attgt_sim")
+    store = ATTgtStore.load("attgt_sim")                 # memory-mapped
+    dyn = store.aggte("dynamic", min_e=-5, max_e=5)       # table by event time
+    dyn.attrs["overall"]                                  # overall ATT, SE, CI
+    store.aggte("group"), store.aggte("calendar"), store.aggte("simple")
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+import mboot_engine
+from cluster_vcov import as_clustering, cluster_se, cluster_sums
+
+# Rows of the stored influence-function matrix converted to float64 at a time
+CHUNK_ROWS = 1 << 16
+# csdid reports SEs at or below this as NaN (degenerate influence function)
+SE_TOL = np.sqrt(np.finfo(float).eps) * 10
+
+INDEX_NAMES = {"simple": None, "group": "group", "dynamic": "event_time", "calendar": "time"}
+
+
+class ATTgtStore:
+    """
+    ATT(g,t) estimates with their influence functions, aggregated on demand.
+
+    Parameters
+    ----------
+    group, t, att : array-like, (cells,)
+        Cohort, period and estimate of each group-time cell.
+    inffunc : array-like, (n, cells)
+        Influence functions of the cells (csdid's MP["inffunc"]["inffunc"]);
+        may be a memory-mapped array.
+    cohort : array-like, (n,)
+        Cohort of each unit, in the row order of inffunc (never-treated
+        units carry a value that is not a cohort of any cell).
+    weights : array-like, (n,), optional
+        Unit weights (csdid's w1); ones by default.
+    periods : array-like, optional
+        All periods of the fit (csdid's tlist), needed for balance_e.
+    clusters : array-like or list of array-like, optional
+        Cluster labels per unit (several: multi-way); units by default.
+    meta : dict, optional
+        Inference defaults: alp, bstrap, biters, cband.
+    """
+
+    def __init__(self, group, t, att, inffunc, cohort, weights=None, periods=None, clusters=None,
+                 meta=None):
+        self.group = np.asarray(group)
+        self.t = np.asarray(t)
+        self.att = np.asarray(att, dtype=np.float64)
+        self.inffunc = inffunc if isinstance(inffunc, np.ndarray) else np.asarray(inffunc)
+        self.cohort = np.asarray(cohort)
+        n = self.inffunc.shape[0]
+        self.weights = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.periods = np.unique(self.t if periods is None else np.asarray(periods))
+        self.clusters = None if clusters is None else as_clustering(clusters)
+        self.meta = {"alp": 0.05, "bstrap": False, "biters": 1000, "cband": False, **(meta or {})}
+        if self.inffunc.shape[1] != len(self.att) or len(self.cohort) != n or len(self.weights) != n:
+            raise ValueError("inffunc must be (units x cells), with one cohort and weight per unit")
+
+    @property
+    def n(self):
+        return self.inffunc.shape[0]
+
+    @classmethod
+    def from_csdid(cls, att_gt, dtype=np.float32, clusters=None):
+        """
+        Store of a fitted csdid ATTgt (compute_inffunc=True).
+
+        The unit cohorts and weights are read from the fit's data as aggte()
+        does; clusters default to the fit's clustervars.
+        """
+        mp, dp = att_gt.MP, att_gt.dp
+        if mp.get("inffunc") is None:
+            raise ValueError("the ATTgt fit has no influence functions (compute_inffunc=False)")
+        data, idname, tname, gname = dp["data"], dp["idname"], dp["tname"], dp["gname"]
+        if dp["panel"]:
+            units = data[data[tname] == np.sort(data[tname].unique())[0]]
+        else:
+            units = data[[idname, gname, "w1"]].groupby(idname, as_index=False).mean()
+
+        if clusters is None:
+            clustervars = dp.get("clustervars")
+            if isinstance(clustervars, (list, tuple)):
+                clustervars = clustervars[0] if clustervars else None
+            if clustervars not in (None, "", idname) and clustervars in units.columns:
+                clusters = units[clustervars].to_numpy()
+
+        meta = {k: dp[k] for k in ("alp", "bstrap", "biters", "cband") if k in dp}
+        return cls(mp["group"], mp["t"], mp["att"],
+                   np.asarray(mp["inffunc"]["inffunc"], dtype=dtype),
+                   units[gname].to_numpy(), units["w1"].to_numpy(), periods=dp["tlist"],
+                   clusters=clusters, meta=meta)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        """
+        Write the store to directory `path`: inffunc.npy (memory-mappable),
+        arrays.npz (cells, units, cluster codes) and meta.json.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "inffunc.npy", self.inffunc)
+        arrays = {"group": self.group, "t": self.t, "att": self.att, "cohort": self.cohort,
+                  "weights": self.weights, "periods": self.periods}
+        if self.clusters is not None:
+            n_ways = (len(self.clusters.codes) + 1).bit_length() - 1
+            arrays["clusters"] = np.vstack(self.clusters.codes[:n_ways])
+        np.savez(path / "arrays.npz", **arrays)
+        with open(path / "meta.json", "w") as f:
+            json.dump({k: (v.item() if isinstance(v, np.generic) else v) for k, v in self.meta.items()},
+                      f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Store saved by save(); the influence functions are memory-mapped unless mmap=False."""
+        path = Path(path)
+        arrays = np.load(path / "arrays.npz")
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        clusters = list(arrays["clusters"]) if "clusters" in arrays else None
+        return cls(arrays["group"], arrays["t"], arrays["att"],
+                   np.load(path / "inffunc.npy", mmap_mode="r" if mmap else None),
+                   arrays["cohort"], arrays["weights"], periods=arrays["periods"],
+                   clusters=clusters, meta=meta)
+
+    # ------------------------------------------------------------------
+    # Aggregation
+    # ------------------------------------------------------------------
+
+    def _cohort_shares(self, keep):
+        """P(G = g) of every kept cell (weighted share of units in its cohort) and the unit cohort codes."""
+        values = np.unique(self.group[keep])
+        unit_code = np.searchsorted(values, self.cohort)
+        in_values = (unit_code < len(values)) & (values[np.minimum(unit_code, len(values) - 1)] == self.cohort)
+        unit_code = np.where(in_values, unit_code, len(values))  # len(values): no cell cohort
+        share = np.bincount(unit_code, self.weights, len(values) + 1)[:-1] / self.n
+        return values, share, unit_code
+
+    def weights_for(self, typec="group", min_e=-np.inf, max_e=np.inf, balance_e=None, na_rm=False):
+        """
+        Linear weights of every parameter of an aggregation.
+
+        Returns (labels, W, H, cohorts): parameter j is att @ W[:, j]; its
+        influence function is inffunc @ W[:, j] + w_i H[c_i, j] with c_i the
+        index of unit i's cohort in `cohorts` (len(cohorts) for units in no
+        cell cohort, whose H row is zero). The last column is the overall ATT.
+        """
+        if typec not in INDEX_NAMES:
+            raise ValueError(f"typec must be one of {list(INDEX_NAMES)}")
+        keep = ~np.isnan(self.att)
+        if not na_rm and not keep.all():
+            raise ValueError("Missing values at att_gt found. If you want to remove these, set `na_rm = True`.")
+        group, t, att = self.group, self.t, self.att
+        cohorts, share, _ = self._cohort_shares(keep)
+        pg = np.zeros(len(att))
+        pg[keep] = share[np.searchsorted(cohorts, group[keep])]
+        n_cells, n_cohorts = len(att), len(cohorts)
+        att0 = np.where(keep, att, 0.0)
+
+        def cells_param(cells, with_wif=True):
+            """Weights (w, h) of the pg-weighted average of `cells`, with the share effect."""
+            w = np.zeros(n_cells)
+            h = np.zeros(n_cohorts + 1)
+            total = pg[cells].sum()
+            w[cells] = pg[cells] / total
+            if with_wif:
+                # csdid's wif(cells) @ att, reduced to a function of the unit's cohort
+                k = np.searchsorted(cohorts, group[cells])
+                m = pg[cells] @ att0[cells]
+                h[:n_cohorts] = (np.bincount(k, att0[cells], n_cohorts) / total
+                                 - np.bincount(k, minlength=n_cohorts) * m / total ** 2)
+            return w, h
+
+        params, labels = [], []
+        event = t - group
+        if typec == "simple":
+            post = keep & (group <= t) & (t <= group + max_e)
+            if not post.any():
+                raise ValueError("No valid att_gt() estimates found for this aggregation.")
+            overall = cells_param(np.flatnonzero(post))
+        elif typec == "group":
+            for g in cohorts:
+                cells = np.flatnonzero(keep & (group == g) & (t >= g) & (t <= g + max_e))
+                if len(cells):
+                    labels.append(g)
+                    params.append(cells_param(cells, with_wif=False))
+            # Overall: cohort-share weighted average of the group effects, with
+            # the effect of estimating those shares
+            pgg = share[np.searchsorted(cohorts, labels)]
+            w = sum(p[0] * s for p, s in zip(params, pgg)) / pgg.sum()
+            att_g = np.array([p[0] @ att0 for p in params])
+            k = np.searchsorted(cohorts, labels)
+            m = pgg @ att_g
+            h = np.zeros(n_cohorts + 1)
+            h[k] = att_g / pgg.sum() - m / pgg.sum() ** 2
+            overall = (w, h)
+        elif typec == "dynamic":
+            include = keep.copy()
+            eseq = np.unique(event[keep])
+            if balance_e is not None:
+                include &= t[keep].max() - group >= balance_e
+                eseq = np.unique(event[include])
+                first = min(self.periods.min(), group[keep].min())
+                eseq = eseq[(eseq <= balance_e) & (eseq >= balance_e - t[keep].max() + first)]
+            eseq = eseq[(eseq >= min_e) & (eseq <= max_e)]
+            if len(eseq) == 0:
+                raise ValueError("No event times fall within the requested window.")
+            for e in eseq:
+                labels.append(e)
+                params.append(cells_param(np.flatnonzero(include & (event == e))))
+            post = [p for e, p in zip(eseq, params) if e >= 0]
+            overall = (sum(p[0] for p in post) / len(post), sum(p[1] for p in post) / len(post)) \
+                if post else (np.full(n_cells, np.nan), np.zeros(n_cohorts + 1))
+        else:  # calendar
+            min_g = group[keep].min()
+            for t1 in np.unique(t[keep]):
+                cells = np.flatnonzero(keep & (t == t1) & (group <= t))
+                if t1 >= min_g and len(cells):
+                    labels.append(t1)
+                    params.append(cells_param(cells))
+            if not params:
+                raise ValueError("No calendar periods have non-missing post-treatment att_gt() estimates.")
+            overall = (sum(p[0] for p in params) / len(params), sum(p[1] for p in params) / len(params))
+
+        params.append(overall)
+        W = np.column_stack([p[0] for p in params])
+        H = np.column_stack([p[1] for p in params])
+        return np.asarray(labels), W, H, cohorts
+
+    def influence(self, W, H, cohorts):
+        """(n, P) influence functions of the parameters given by weights_for()."""
+        _, _, unit_code = self._cohort_shares(np.isin(self.group, cohorts))
+        W = np.nan_to_num(W)
+        out = np.empty((self.n, W.shape[1]))
+        for start in range(0, self.n, CHUNK_ROWS):
+            block = np.asarray(self.inffunc[start:start + CHUNK_ROWS], dtype=np.float64)
+            out[start:start + CHUNK_ROWS] = np.nan_to_num(block) @ W
+        return out + self.weights[:, None] * H[unit_code]
+
+    def aggte(self, typec="group", min_e=-np.inf, max_e=np.inf, balance_e=None, na_rm=False,
+              bstrap=None, biters=None, cband=None, alp=None, seed=None):
+        """
+        csdid aggregation of the stored ATT(g,t) (same arguments as ATTgt.aggte()).
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per group, event time or period (empty for "simple")
+            with Estimate, SE, LB CI and UB CI; the band uses the uniform
+            critical value when cband. attrs holds overall (the same columns
+            for the overall ATT), type and crit_val.
+        """
+        meta = self.meta
+        bstrap = meta["bstrap"] if bstrap is None else bstrap
+        biters = meta["biters"] if biters is None else biters
+        cband = meta["cband"] if cband is None else cband
+        alp = meta["alp"] if alp is None else alp
+
+        labels, W, H, cohorts = self.weights_for(typec, min_e, max_e, balance_e, na_rm)
+        estimate = np.nan_to_num(self.att) @ W
+        inf = self.influence(W, H, cohorts)
+        n_params = len(labels)
+        crit_val = norm.ppf(1 - alp / 2)
+
+        if bstrap or (cband and n_params):
+            # As in csdid, the bootstrap clusters on the first cluster variable only
+            scores = inf if self.clusters is None else cluster_sums(
+                inf, self.clusters.codes[0], self.clusters.n_clusters[0])
+            bres = mboot_engine.multiplier_bootstrap(scores, biters, seed=seed)
+            if bstrap:
+                se = mboot_engine.bootstrap_stats(bres, self.n, scores.shape[0], alp)["se"]
+            if cband and n_params:
+                band = mboot_engine.bootstrap_stats(bres[:, :n_params], self.n, scores.shape[0], alp)
+                if np.isfinite(band["crit_val"]) and band["crit_val"] >= crit_val:
+                    crit_val = band["crit_val"]
+        if not bstrap:
+            if self.clusters is not None:
+                se = cluster_se(inf, self.clusters) / self.n
+            else:
+                se = np.sqrt((inf ** 2).sum(axis=0)) / self.n
+        se = np.where(se <= SE_TOL, np.nan, se)
+
+        z = np.append(np.full(n_params, crit_val), norm.ppf(1 - alp / 2))
+        table = pd.DataFrame({"Estimate": estimate, "SE": se,
+                              "LB CI": estimate - z * se, "UB CI": estimate + z * se})
+        overall = table.iloc[n_params].rename("overall")
+        table = table.iloc[:n_params].set_axis(pd.Index(labels, name=INDEX_NAMES[typec]))
+        table.attrs.update(overall=overall, type=typec, crit_val=crit_val)
+        return table
@@ -0,0 +1,215 @@
+"""
+File: bench_executor.py
+Purpose: Run one benchmark call in a child process with a hard deadline and memory cap
+
+signal.alarm() cannot interrupt long C/NumPy/polars calls, and an estimator
+run in the notebook kernel keeps its memory after it returns. Here each call
+runs in its own process (and process group). The child caps its address
+space with RLIMIT_AS, measures itself with trials.timed_trials and sends
+timing, peak memory and status back through a pipe. When the deadline passes,
+the parent reads the child's CPU time and peak RSS from /proc (Linux) and
+SIGKILLs the whole process group, so a timed-out estimator stops consuming
+CPU.
+
+With threads=n the child is a fresh "spawn" interpreter started with
+thread_budget.thread_env(n) and pinned to n CPUs, so polars, BLAS, numba and
+our own pools all size themselves to n; the pool sizes it actually ran with
+are returned as "threads". The child is not a daemon, so the benchmarked call
+may start process pools of its own (spec_pool, sim_panel, subsample_inference).
+
+A child is also spawned, not forked, once polars is imported: a fork taken
+while polars' thread pool is live can deadlock. Calls that cannot be pickled
+by reference (closures and functions defined in a notebook) are then shipped
+by value with cloudpickle when it is installed.
+
+Usage:
+    from bench_executor import run_isolated
+    res = run_isolated(fit_function, timeout_sec=300, mem_limit_mb=16000)
+    res["status"], res["time"], res["cpu_time"], res["peak_rss_mb"]
+    res = run_isolated(fit_function, threads=4)   # pinned thread budget
+"""
+
+import functools
+import multiprocessing as mp
+import os
+import signal
+import sys
+import time
+
+from thread_budget import pin_cpus, thread_environ, thread_report
+from trials import timed_trials
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import cloudpickle
+except ImportError:
+    cloudpickle = None
+
+
+def _proc_usage(pid):
+    """(CPU seconds, peak RSS in MB) of a live process from /proc, NaN where unavailable."""
+    cpu = peak = float("nan")
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return cpu, peak
+
+
+class _ByValue:
+    """A callable pickled with cloudpickle, so that a spawned child can rebuild notebook closures."""
+
+    def __init__(self, func):
+        self.payload = cloudpickle.dumps(func)
+        self.func = None
+
+    def __getstate__(self):
+        return {"payload": self.payload, "func": None}
+
+    def __call__(self, *args, **kwargs):
+        if self.func is None:
+            self.func = cloudpickle.loads(self.payload)
+        return self.func(*args, **kwargs)
+
+
+def default_start_method(threads=None):
+    """
+    "fork" where available, unless a thread budget is set or polars is
+    imported (its live thread pool does not survive a fork); else "spawn".
+    """
+    if threads is None and "polars" not in sys.modules and "fork" in mp.get_all_start_methods():
+        return "fork"
+    return "spawn"
+
+
+def _child(conn, func, mem_limit_mb, extract, n_trials, warmup, threads=None):
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    if threads is not None:
+        pin_cpus(threads)
+    if mem_limit_mb and resource is not None:
+        limit = int(mem_limit_mb * 1024 ** 2)
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass  # e.g. macOS does not enforce RLIMIT_AS
+    result, record, error = timed_trials(func, n_trials=n_trials, warmup=warmup)
+    message = {
+        "status": "completed" if error is None else f"error: {error[:150]}",
+        "time": record["Runtime_sec"],
+        "cpu_time": record["CPU_sec"],
+        "peak_rss_mb": record["Peak_RSS_MB"],
+        "trials": {k: v for k, v in record.items() if k not in ("Runtime_sec", "CPU_sec", "Peak_RSS_MB")},
+        "output": None,
+        "threads": thread_report() if threads is not None else {},
+    }
+    if error is None and extract is not None:
+        try:
+            message["output"] = extract(result)
+        except Exception as e:
+            message["status"] = f"error: extract failed: {str(e)[:150]}"
+    conn.send(message)
+    conn.close()
+
+
+def _kill(process):
+    """Kill the child and everything it started, then reap it."""
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            process.kill()
+    process.join()
+
+
+def run_isolated(func, *args, timeout_sec=300, mem_limit_mb=None, extract=None,
+                 start_method=None, n_trials=1, warmup=0, threads=None, **kwargs):
+    """
+    Call func(*args, **kwargs) in a child process with a wall-clock deadline.
+
+    Parameters
+    ----------
+    func : callable
+        The benchmarked call. It may start process pools of its own. With
+        "fork" it may be any closure; with "spawn"/"forkserver" it must be
+        importable, or cloudpickle must be installed.
+    timeout_sec : float
+        Hard wall-clock deadline; the child's process group is SIGKILLed when
+        it passes.
+    mem_limit_mb : float, optional
+        Address-space cap for the child (RLIMIT_AS). Exceeding it surfaces as
+        a MemoryError status (or a crash if raised inside native code).
+    extract : callable, optional
+        Runs in the child on func's result; its (picklable) return value is
+        sent back as "output". Fitted models are otherwise left in the child.
+    start_method : str, optional
+        multiprocessing start method; default_start_method(threads) by
+        default.
+    n_trials, warmup : int
+        Repeated-trial mode (see trials.timed_trials); the deadline covers
+        all runs together.
+    threads : int, optional
+        Thread budget of the child (see thread_budget). Pools that already
+        exist in a forked child keep their size, hence the spawn default;
+        func and its arguments must then be picklable.
+
+    Returns
+    -------
+    dict
+        status ("completed", "timeout", "error: ...", "crashed: ..."), time
+        (wall seconds, median over trials, measured even on timeout),
+        cpu_time, peak_rss_mb, trials (cold-start time, IQR, CI, ...),
+        output and threads (pool sizes in the child when threads is given).
+    """
+    if start_method is None:
+        start_method = default_start_method(threads)
+    ctx = mp.get_context(start_method)
+    call = functools.partial(func, *args, **kwargs)
+    if start_method != "fork" and cloudpickle is not None:
+        call = _ByValue(call)
+        extract = _ByValue(extract) if extract is not None else None
+
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child, args=(send_conn, call, mem_limit_mb, extract, n_trials, warmup,
+                                               threads))
+    start = time.perf_counter()
+    if threads is None:
+        process.start()
+    else:
+        # A spawned child inherits os.environ as it is at start()
+        with thread_environ(threads):
+            process.start()
+    send_conn.close()
+
+    try:
+        if recv_conn.poll(timeout_sec):
+            try:
+                result = recv_conn.recv()
+            except EOFError:
+                # Child died without reporting (e.g. killed by the OOM killer)
+                process.join()
+                result = {"status": f"crashed: exit code {process.exitcode}",
+                          "time": time.perf_counter() - start,
+                          "cpu_time": float("nan"), "peak_rss_mb": float("nan"), "trials": {},
+                          "output": None, "threads": {}}
+        else:
+            cpu_time, peak_rss = _proc_usage(process.pid)
+            result = {"status": f"timeout: exceeded {timeout_sec} seconds",
+                      "time": time.perf_counter() - start,
+                      "cpu_time": cpu_time, "peak_rss_mb": peak_rss, "trials": {}, "output": None,
+                      "threads": {}}
+    finally:
+        _kill(process)
+        recv_conn.close()
+    return result
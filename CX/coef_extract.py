@@ -0,0 +1,184 @@
+"""
+File: coef_extract.py
+Purpose: Columnar coefficient/SE extraction for every estimator in the benchmarks
+
+Each extractor turns one estimator output into a typed polars table with the
+coefficient-file layout (Example, Model, Type, Index, Estimate, SE), built
+from whole columns at once: labels like "Effect_3" are parsed with one
+vectorized regex, and there is no per-row iterrows()/append bookkeeping.
+Tables from many specs are concatenated once and feed coefficients_*.csv and
+the cross-platform parity checks.
+
+Type / Index conventions:
+  - did_multiplegt_dyn, dcdh_stream: Effect l, Placebo l, Avg_Effect 0 (as in the Stata/R files)
+  - csdid aggte, diff_diff, pyfixest, imputation event studies: Event e (event time), Avg_Effect 0
+
+Usage:
+    from coef_extract import from_dyn_result, concat, parity
+    tables.append(from_dyn_result(result, example="Wagepan", model="Baseline"))
+    concat(tables).write_csv("coefficients_Python.csv")
+    parity(pl.read_csv("coefficients_stata.csv"), pl.read_csv("coefficients_R_polars.csv"), "Stata", "Polars")
+"""
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+KEYS = ["Example", "Model", "Type", "Index"]
+
+COEF_SCHEMA = {
+    "Example": pl.Utf8,
+    "Model": pl.Utf8,
+    "Type": pl.Utf8,
+    "Index": pl.Int64,
+    "Estimate": pl.Float64,
+    "SE": pl.Float64,
+}
+
+
+def empty():
+    """A coefficient table with no rows."""
+    return pl.DataFrame(schema=COEF_SCHEMA)
+
+
+def _table(example, model, types, index, estimate, se):
+    n = len(estimate)
+    return pl.DataFrame({
+        "Example": np.full(n, example, dtype=object),
+        "Model": np.full(n, model, dtype=object),
+        "Type": types,
+        "Index": index,
+        "Estimate": estimate,
+        "SE": se,
+    }, schema=COEF_SCHEMA)
+
+
+def _column(frame, *names):
+    """First of `names` present in a pandas frame, as float64 (NaN if none)."""
+    for name in names:
+        if name in frame.columns:
+            return pd.to_numeric(frame[name], errors="coerce").to_numpy(dtype=float)
+    return np.full(len(frame), np.nan)
+
+
+def _trailing_int(labels):
+    """Trailing integer of each label ("Effect_12" -> 12), null where there is none."""
+    return (pl.Series(labels, dtype=pl.Utf8)
+            .str.extract(r"(-?\d+)$", 1)
+            .cast(pl.Int64, strict=False))
+
+
+def _dyn_block(frame, kind, example, model):
+    labels = pd.Index(frame.index).astype(str)
+    average = np.asarray(labels == "Average")
+    types = np.where(average, "Avg_Effect", kind)
+    index = _trailing_int(labels).zip_with(pl.Series(~average), pl.Series(np.zeros(len(labels), dtype=np.int64)))
+    return _table(example, model, types, index,
+                  _column(frame, "Estimate", "estimate"), _column(frame, "SE", "se"))
+
+
+def from_dyn_result(result, example, model):
+    """Effects (with the Average row) and Placebos of a did_multiplegt_dyn result dict."""
+    dyn = (result or {}).get("did_multiplegt_dyn", {})
+    tables = []
+    for key, kind in [("Effects", "Effect"), ("Placebos", "Placebo")]:
+        frame = dyn.get(key)
+        if frame is not None and len(frame) > 0:
+            if isinstance(frame, pl.DataFrame):
+                frame = frame.to_pandas()
+            tables.append(_dyn_block(frame, kind, example, model))
+    return concat(tables)
+
+
+def from_dcdh_stream(table, example, model):
+    """Effects, placebos and the average total effect of a dcdh_stream.dcdh_stream table (one outcome)."""
+    labels = pd.Index(table.index).astype(str)
+    average = np.asarray(labels == "Av_tot_eff")
+    types = np.where(average, "Avg_Effect", np.where(labels.str.startswith("Placebo"), "Placebo", "Effect"))
+    index = _trailing_int(labels).zip_with(pl.Series(~average), pl.Series(np.zeros(len(labels), dtype=np.int64)))
+    return _table(example, model, types, index, _column(table, "Estimate"), _column(table, "SE"))
+
+
+def from_csdid_aggte(aggte, example, model):
+    """Event-time effects and the overall ATT of a csdid dynamic aggte() result."""
+    atte = aggte.atte if hasattr(aggte, "atte") else aggte
+    event = np.asarray(atte["egt"], dtype=np.int64)
+    estimate = np.asarray(atte["att_egt"], dtype=float).ravel()
+    se = np.asarray(atte["se_egt"], dtype=float).ravel()
+    overall_se = np.asarray(atte["overall_se"], dtype=float).ravel()
+    return concat([
+        _table(example, model, np.full(len(event), "Event"), event, estimate, se),
+        _table(example, model, ["Avg_Effect"], [0], [float(atte["overall_att"])],
+               [overall_se[0] if overall_se.size else np.nan]),
+    ])
+
+
+def from_diff_diff(results, example, model):
+    """Event-study effects of a diff_diff CallawaySantAnna result (event_study_effects)."""
+    effects = getattr(results, "event_study_effects", None)
+    if not effects:
+        return empty()
+    frame = pd.DataFrame.from_dict(effects, orient="index")
+    return _table(example, model, np.full(len(frame), "Event"),
+                  np.asarray(frame.index, dtype=np.int64),
+                  _column(frame, "effect", "Estimate"), _column(frame, "se", "SE"))
+
+
+def from_pyfixest(fit, example, model):
+    """
+    Event-time coefficients of a pyfixest fit (sunab / i() terms).
+
+    Terms whose name carries an event time ("...[T.-3]", "...::3") become
+    Event rows; other terms are dropped.
+    """
+    coef, se = fit.coef(), fit.se()
+    names = pl.Series(coef.index.astype(str), dtype=pl.Utf8)
+    event = (names.str.extract(r"(?:\[T\.|::)(-?\d+)(?:\.0)?\]?$", 1)
+             .cast(pl.Int64, strict=False).to_numpy())
+    keep = ~np.isnan(event.astype(float))
+    return _table(example, model, np.full(int(keep.sum()), "Event"), event[keep].astype(np.int64),
+                  coef.to_numpy(dtype=float)[keep], se.reindex(coef.index).to_numpy(dtype=float)[keep])
+
+
+def from_imputation(table, example, model):
+    """Event-time rows (pre-trends included) and the overall ATT of an imputation.did_imputation table."""
+    tables = [_table(example, model, np.full(len(table), "Event"),
+                     np.asarray(table.index, dtype=np.int64),
+                     _column(table, "Estimate"), _column(table, "SE"))]
+    overall = table.attrs.get("overall")
+    if overall is not None:
+        tables.append(_table(example, model, ["Avg_Effect"], [0],
+                             [float(overall["Estimate"])], [float(overall["SE"])]))
+    return concat(tables)
+
+
+def concat(tables):
+    """Concatenate coefficient tables (one allocation), or an empty table."""
+    tables = [t for t in tables if t is not None and t.height]
+    return pl.concat(tables, how="vertical") if tables else empty()
+
+
+def parity(left, right, left_name="left", right_name="right"):
+    """
+    Outer-join two coefficient tables on KEYS and add differences and ratios.
+
+    Adds Estimate/SE columns suffixed with the platform names plus
+    Estimate_Diff, SE_Diff, Estimate_Rel_Diff and SE_Rel_Diff (percent of
+    `left`) and SE_Ratio, all computed as column expressions.
+    """
+    cast = [pl.col("Index").cast(pl.Int64), pl.col("Estimate").cast(pl.Float64), pl.col("SE").cast(pl.Float64)]
+    a = left.with_columns(cast).rename({"Estimate": f"Estimate_{left_name}", "SE": f"SE_{left_name}"})
+    b = right.with_columns(cast).rename({"Estimate": f"Estimate_{right_name}", "SE": f"SE_{right_name}"})
+    merged = a.join(b, on=KEYS, how="full", coalesce=True)
+
+    def rel(col):
+        lo, hi = pl.col(f"{col}_{left_name}"), pl.col(f"{col}_{right_name}")
+        return pl.when(lo != 0).then((hi - lo) / lo.abs() * 100).otherwise(None)
+
+    return merged.with_columns(
+        (pl.col(f"Estimate_{right_name}") - pl.col(f"Estimate_{left_name}")).alias("Estimate_Diff"),
+        (pl.col(f"SE_{right_name}") - pl.col(f"SE_{left_name}")).alias("SE_Diff"),
+        rel("Estimate").alias("Estimate_Rel_Diff"),
+        rel("SE").alias("SE_Rel_Diff"),
+        (pl.col(f"SE_{right_name}") / pl.col(f"SE_{left_name}")).alias("SE_Ratio"),
+    )
@@ -0,0 +1,341 @@
+"""
+File: dcdh_stream.py
+Purpose: Memory-bounded de Chaisemartin & D'Haultfoeuille event-study estimates for binary staggered designs
+
+With a binary, absorbing treatment, every DID_l / placebo of
+did_multiplegt_dyn (no controls, no weights, clustered by group) is a linear
+combination of long differences Y_{g,t} - Y_{g,F_g-1}, and its
+group-level influence function only needs per-cohort sufficient statistics:
+the number of groups, the column sums of the (groups x periods) outcome
+matrix and its Gram matrix. prepare_panel() streams a balanced panel sorted
+by group and time in chunks of whole groups and accumulates those statistics
+per cohort partition; dcdh_stream() merges them into the estimates. Peak
+memory is one chunk plus a T x T matrix per cohort, whatever the number of
+groups.
+
+Clustering at a coarser level (cluster=, one- or multi-way, constant within
+groups) adds per-cluster outcome sums per cohort to the same pass, encoded
+once by cluster_vcov; the SEs of all effects, placebos and the average total
+effect then come from one product of those sums with the stacked weights.
+
+The prepared panel depends only on (data, outcome, group, time, cohort), so
+a sweep of specs (effects, placebos, normalized, only never-switchers as
+controls, CI level) reads the data once and each further spec costs a few
+T x T products.
+
+Several outcomes sharing group, time and cohort (outcome=[...]) go through
+the same pass as one (outcomes x groups x periods) array: the cohort and
+switcher cells and the estimator weights depend only on the treatment
+paths, so they are built once and applied to the K x T sums and K x T x T
+Gram matrices of all outcomes at once. K outcomes cost one fit plus a K-fold
+larger (still T x T sized) accumulation.
+
+Usage:
+    from dcdh_stream import dcdh_stream, prepare_panel
+    table = dcdh_stream(df_pl, outcome="y", group="id", time="year",
+                        cohort="first_treat", effects=5, placebo=3)
+
+    panel = prepare_panel(df_pl, outcome="y", group="id", time="year", cohort="first_treat")
+    tables = {spec: dcdh_stream(panel, effects=5, placebo=3, **options) for spec, options in specs.items()}
+
+    stacked = dcdh_stream(df_pl, outcome=["y1", "y2", "y3"], group="id", time="year",
+                          cohort="first_treat", effects=5)    # index (Outcome, Effect_1 ...)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import stats as sps
+
+from cluster_vcov import cluster_sums, clustering
+
+# Groups per streamed chunk: 100K groups x 10 periods is ~8 MB of float64 outcomes
+CHUNK_GROUPS = 100_000
+
+# Sorted periods, {cohort: [n_groups, column sums, Gram matrix]}, with a
+# cluster option [(sign, {cohort: [groups per cluster, outcome sums per cluster]})]
+# per cluster_vcov subset, and the outcome names when several were prepared
+PreparedPanel = namedtuple("PreparedPanel", ["periods", "stats", "clusters", "outcomes"],
+                           defaults=(None, None))
+
+
+def _as_table(data, columns):
+    if isinstance(data, pa.Table):
+        return data.select(columns)
+    if isinstance(data, pd.DataFrame):
+        return pa.Table.from_pandas(data[columns], preserve_index=False)
+    return data.select(columns).to_arrow()  # polars, zero-copy
+
+
+def cohort_stats(data, outcome, group, time, cohort, chunk_groups=CHUNK_GROUPS, by_pattern=False,
+                 cluster=None):
+    """
+    Per-cohort sufficient statistics of a balanced panel, streamed in chunks of whole groups.
+
+    Returns (periods, stats, clusters) where stats maps each cohort value to
+    [n_groups, column sums (T,), Gram matrix (T, T)] of the outcome matrix.
+    With a list of K outcomes, column sums are (K, T) and Gram matrices
+    (K, T, T), one per outcome.
+    With by_pattern, groups are further split by which periods have a
+    non-missing outcome: keys become (cohort, observed) with `observed` a
+    tuple of 0/1 per period, and missing outcomes count as zero.
+    With cluster (column name or list of names, constant within groups),
+    the same pass also accumulates, for every cluster_vcov subset, the
+    number of groups and the outcome sums of each cluster per key; they are
+    returned as a third element (None without clusters).
+    Raises ValueError unless the panel is balanced and sorted by group, time.
+    """
+    outcomes = [outcome] if isinstance(outcome, str) else list(outcome)
+    if by_pattern and len(outcomes) > 1:
+        raise ValueError("by_pattern needs a single outcome (missingness patterns differ across outcomes)")
+    cluster = [cluster] if isinstance(cluster, str) else list(cluster or [])
+    if cluster == [group]:
+        cluster = []  # the Gram matrices already give group-clustered SEs
+    table = _as_table(data, [group, time, cohort] + outcomes
+                      + [c for c in cluster if c not in (group, time)])
+    periods = np.sort(pc.unique(table.column(time)).to_numpy())
+    n_periods = len(periods)
+    if table.num_rows % n_periods:
+        raise ValueError("dcdh_stream needs a balanced panel (every group observed in every period)")
+
+    # Cluster labels of each group (its first row), encoded once for all chunks
+    clusters = None
+    if cluster:
+        first_rows = pa.array(np.arange(0, table.num_rows, n_periods))
+        cl = clustering(*[table.column(c).take(first_rows).to_numpy() for c in cluster])
+        clusters = [(sign, {}) for sign in cl.signs]
+
+    stats = {}
+    step = chunk_groups * n_periods
+    for start in range(0, table.num_rows, step):
+        chunk = table.slice(start, step)
+        n = chunk.num_rows // n_periods
+        ids = chunk.column(group).to_numpy().reshape(n, n_periods)
+        times = chunk.column(time).to_numpy().reshape(n, n_periods)
+        cohorts = chunk.column(cohort).to_numpy().reshape(n, n_periods)
+        if not ((ids == ids[:, :1]).all() and (times == periods).all() and (cohorts == cohorts[:, :1]).all()):
+            raise ValueError("dcdh_stream needs a balanced panel sorted by group and time "
+                             "with a time-invariant cohort")
+        if isinstance(outcome, str):
+            Y = chunk.column(outcome).to_numpy().astype(np.float64).reshape(n, n_periods)
+        else:
+            # outcomes x groups x periods, one contiguous block per outcome
+            Y = np.stack([np.asarray(chunk.column(o).to_numpy(), dtype=np.float64).reshape(n, n_periods)
+                          for o in outcomes])
+        first = cohorts[:, 0]
+        if by_pattern:
+            observed = ~np.isnan(Y)
+            Y = np.where(observed, Y, 0.0)
+            keys, part = np.unique(np.column_stack([first, observed]), axis=0, return_inverse=True)
+            keys = [(k[0].item(), tuple(int(o) for o in k[1:])) for k in keys]
+        else:
+            keys, part = np.unique(first, return_inverse=True)
+            keys = [k.item() for k in keys]
+        for i, key in enumerate(keys):
+            in_key = part.ravel() == i
+            Yf = Y[..., in_key, :]
+            shape = Y.shape[:-2] + (n_periods,)  # (T,), or (K, T) with K outcomes
+            entry = stats.setdefault(key, [0, np.zeros(shape), np.zeros(shape + (n_periods,))])
+            entry[0] += Yf.shape[-2]
+            entry[1] += Yf.sum(axis=-2)
+            entry[2] += np.swapaxes(Yf, -1, -2) @ Yf  # batched over outcomes
+            if clusters is not None:
+                first_group = start // n_periods
+                Yg = np.moveaxis(Yf, -2, 0).reshape(Yf.shape[-2], -1)  # groups x (K * T)
+                for (_, per_key), c, n_c in zip(clusters, cl.codes, cl.n_clusters):
+                    c_chunk = c[first_group:first_group + n][in_key]
+                    centry = per_key.setdefault(key, [np.zeros(n_c), np.zeros((n_c,) + shape)])
+                    centry[0] += np.bincount(c_chunk, minlength=n_c)
+                    centry[1] += cluster_sums(Yg, c_chunk, n_c).reshape(centry[1].shape)
+    return periods, stats, clusters
+
+
+def prepare_panel(data, outcome, group, time, cohort, chunk_groups=CHUNK_GROUPS, by_pattern=False,
+                  cluster=None):
+    """Stream the panel once into the PreparedPanel shared by every spec (see cohort_stats)."""
+    return PreparedPanel(*cohort_stats(data, outcome, group, time, cohort, chunk_groups, by_pattern,
+                                       cluster),
+                         outcomes=None if isinstance(outcome, str) else list(outcome))
+
+
+def _cells(periods, stats, lag, never_treated, placebo=False, only_never_switchers=False):
+    """
+    (switcher cohort, contrast vector, control cohorts) for effect or placebo `lag`.
+
+    Switchers in cohort F use as base the last observed period before F
+    (F-1 with consecutive periods, F-2 with biennial ones); lags count
+    observed periods. Controls are the cohorts not yet treated `lag` periods
+    after the base (never-treated included), or only the never-treated with
+    only_never_switchers. A placebo compares the period `lag` before the
+    base with the base and needs the matching effect to exist.
+    """
+    n_periods = len(periods)
+    cells = []
+    for f in sorted(k for k in stats if k != never_treated):
+        base = int(np.searchsorted(periods, f)) - 1
+        if base < 0 or base + lag >= n_periods:
+            continue
+        target = base - lag if placebo else base + lag
+        if target < 0:
+            continue
+        controls = [k for k in stats
+                    if k == never_treated or (not only_never_switchers and k > periods[base + lag])]
+        if not controls:
+            continue
+        d = np.zeros(n_periods)
+        d[target] += 1.0
+        d[base] -= 1.0
+        cells.append((f, d, controls))
+    return cells
+
+
+def _linear_weights(stats, cells):
+    """
+    Per-cohort weights (a, mu) of the estimator sum_P a_P . Y_P and its centring.
+
+    The influence function of group g in cohort P is a_P . y_g - mu_P, where
+    mu_P removes the cell means of the long differences it enters: the
+    switchers' mean, and for controls the mean of all control cohorts of the
+    cell (the influence function of the pooled control mean), not each
+    cohort's own mean as did_multiplegt_dyn's variance does. a_P only
+    depends on the cohort sizes; with K outcomes mu_P is a (K,) vector.
+    """
+    n_switchers = sum(stats[f][0] for f, _, _ in cells)
+    weights = {}
+    for f, d, controls in cells:
+        n_f, s_f, _ = stats[f]
+        n_c = sum(stats[k][0] for k in controls)
+        mean_c = sum(stats[k][1] for k in controls) @ d / n_c
+        a, mu = weights.setdefault(f, [np.zeros_like(d), 0.0])
+        weights[f] = [a + d / n_switchers, mu + (s_f @ d / n_f) / n_switchers]
+        scale = -n_f / n_c / n_switchers
+        for k in controls:
+            a, mu = weights.setdefault(k, [np.zeros_like(d), 0.0])
+            weights[k] = [a + scale * d, mu + scale * mean_c]
+    return weights, n_switchers
+
+
+def _estimate(stats, weights):
+    theta = sum(stats[k][1] @ a for k, (a, _) in weights.items())
+    var = sum(stats[k][2] @ a @ a - 2 * mu * (stats[k][1] @ a) + stats[k][0] * mu ** 2
+              for k, (a, mu) in weights.items())
+    return theta, np.sqrt(np.maximum(var, 0.0))
+
+
+def _cluster_se(clusters, estimators):
+    """
+    Cluster-robust SEs of several linear estimators in one pass over the cluster sums.
+
+    Each estimator is a {cohort: (a, mu)} dict; the cluster scores of all of
+    them are sum_P (sums_P @ A_P - counts_P mu_P'), with A_P the (T x J)
+    stacked a vectors, combined over the cluster_vcov subsets with their signs.
+    Returns (J,) SEs, or (J, K) with K outcomes.
+    """
+    var = 0.0
+    for sign, per_key in clusters:
+        scores = 0.0
+        for k, (counts, sums) in per_key.items():
+            A = np.column_stack([w[k][0] if k in w else np.zeros(sums.shape[-1]) for w in estimators])
+            mu = np.stack([np.broadcast_to(w[k][1] if k in w else 0.0, sums.shape[1:-1])
+                           for w in estimators], axis=-1)
+            scores = scores + sums @ A - counts.reshape((-1,) + (1,) * mu.ndim) * mu
+        var = var + sign * (scores ** 2).sum(axis=0)
+    return np.moveaxis(np.sqrt(np.maximum(var, 0.0)), -1, 0)
+
+
+def _combine(parts):
+    """Weighted sum of several (weights, scale) estimators, cohort by cohort."""
+    combined = {}
+    for weights, scale in parts:
+        for k, (a, mu) in weights.items():
+            a0, mu0 = combined.get(k, [0.0, 0.0])
+            combined[k] = [a0 + scale * a, mu0 + scale * mu]
+    return combined
+
+
+def dcdh_stream(data, outcome=None, group=None, time=None, cohort=None, effects=1, placebo=0,
+                never_treated=0, normalized=False, only_never_switchers=False, cluster=None,
+                chunk_groups=CHUNK_GROUPS, ci_level=95):
+    """
+    Dynamic effects, placebos and average total effect of a binary staggered design.
+
+    Parameters
+    ----------
+    data : PreparedPanel, pyarrow.Table, polars or pandas DataFrame
+        A prepare_panel() result, or a balanced panel sorted by group and
+        time. A memory-mapped Arrow table (data_cache.load_table) or a polars
+        frame is read without copying.
+    outcome, group, time, cohort : str
+        Column names (not needed for a PreparedPanel); `cohort` is the first
+        treated period (never_treated for groups that are never treated).
+        `outcome` may be a list of columns, estimated together.
+    effects, placebo : int
+        Number of dynamic effects and placebos.
+    never_treated : scalar
+        Cohort value of never-treated groups.
+    normalized : bool
+        Divide effect and placebo l by l, the cumulated treatment change of a
+        binary absorbing switcher (did_multiplegt_dyn's normalized option).
+    only_never_switchers : bool
+        Use only never-treated groups as controls.
+    cluster : str or list of str, optional
+        Cluster variable(s), constant within groups (several: multi-way);
+        groups are the clusters by default. For a PreparedPanel, pass it to
+        prepare_panel() instead.
+    chunk_groups : int
+        Groups per streamed chunk; bounds the memory used.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Rows Effect_1..Effect_L, Placebo_1..Placebo_K and Av_tot_eff with
+        columns Estimate, SE, LB CI, UB CI and Switchers. The average total
+        effect weights each effect by its number of switchers. With several
+        outcomes the tables are stacked under an Outcome index level.
+    """
+    if not isinstance(data, PreparedPanel):
+        data = prepare_panel(data, outcome, group, time, cohort, chunk_groups, cluster=cluster)
+    periods, stats = data.periods, data.stats
+    z = sps.norm.ppf(0.5 + ci_level / 200)
+    rows, parts = {}, []
+
+    def add(name, cells, scale=1.0):
+        if not cells:
+            return None
+        weights, n_switchers = _linear_weights(stats, cells)
+        rows[name] = (weights, scale, n_switchers)
+        return weights, n_switchers
+
+    for lag in range(1, effects + 1):
+        part = add(f"Effect_{lag}", _cells(periods, stats, lag, never_treated,
+                                           only_never_switchers=only_never_switchers),
+                   scale=lag if normalized else 1.0)
+        if part is not None:
+            parts.append(part)
+    for lag in range(1, placebo + 1):
+        add(f"Placebo_{lag}", _cells(periods, stats, lag, never_treated, placebo=True,
+                                     only_never_switchers=only_never_switchers),
+            scale=lag if normalized else 1.0)
+    if parts:
+        total = sum(n for _, n in parts)
+        rows["Av_tot_eff"] = (_combine([(w, n / total) for w, n in parts]), 1.0, total)
+
+    if data.clusters is not None and rows:
+        cluster_se = dict(zip(rows, _cluster_se(data.clusters, [w for w, _, _ in rows.values()])))
+    table = {}
+    for name, (weights, scale, n_switchers) in rows.items():
+        theta, se = _estimate(stats, weights)
+        if data.clusters is not None:
+            se = cluster_se[name]
+        theta, se = theta / scale, se / scale
+        table[name] = {"Estimate": theta, "SE": se, "LB CI": theta - z * se,
+                       "UB CI": theta + z * se, "Switchers": n_switchers}
+    if data.outcomes is None:
+        return pd.DataFrame.from_dict(table, orient="index")
+    return pd.concat({y: pd.DataFrame.from_dict({name: {c: np.broadcast_to(v, len(data.outcomes))[j]
+                                                        for c, v in row.items()}
+                                                 for name, row in table.items()}, orient="index")
+                      for j, y in enumerate(data.outcomes)}, names=["Outcome", None])
@@ -0,0 +1,153 @@
+"""
+File: fe_demean.py
+Purpose: Within-transform engine for high-dimensional fixed effects and cluster-robust OLS
+
+The outcome and regressors are copied once into a Fortran-ordered float64
+block and demeaned in place by alternating projections: for each fixed-effect
+dimension, group means are segment sums (np.bincount over integer codes)
+divided by group sizes, subtracted column by column. Sweeps repeat until the
+largest mean removed in a sweep falls below `tol`. A balanced two-way panel
+is fully demeaned by the first sweep, and the second (which removes nothing)
+confirms it, so it reports 2 iterations. Any number of FE dimensions works,
+and no frame-sized pandas intermediates are created. feols() warns when
+max_iter is reached first.
+
+feols() regresses the demeaned outcome on the demeaned regressors (weighted
+means and WLS when observation weights are given) and computes cluster-robust
+(CR1) standard errors from cluster-summed scores (cluster_vcov, one- or
+multi-way). Degrees of freedom follow fixest's default: fixed effects nested
+in a cluster variable are not counted.
+
+Usage:
+    from fe_demean import feols
+    table = feols(df["y"], df[["treated"]], fe=[df["id"], df["year"]], cluster=df["id"])
+    table.loc["treated", "Estimate"], table.attrs["iterations"]
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sps
+
+from cluster_vcov import as_clustering, codes, meat
+
+TOL = 1e-10
+MAX_ITER = 10_000
+
+
+def demean(X, fe, weights=None, tol=TOL, max_iter=MAX_ITER):
+    """
+    Remove the fixed effects from the columns of X in place.
+
+    Parameters
+    ----------
+    X : float64 array (n, k)
+        Modified in place; Fortran order keeps each column contiguous.
+    fe : list of (codes, n_levels)
+        Integer-coded fixed effects (see codes()).
+    weights : array (n,), optional
+        Observation weights (weighted group means).
+
+    Returns
+    -------
+    (iterations, converged)
+    """
+    counts = [np.bincount(c, weights=weights, minlength=n) for c, n in fe]
+    for it in range(1, max_iter + 1):
+        change = 0.0
+        for (c, n), cnt in zip(fe, counts):
+            for j in range(X.shape[1]):
+                col = X[:, j] if weights is None else X[:, j] * weights
+                means = np.bincount(c, weights=col, minlength=n) / cnt
+                change = max(change, np.abs(means).max())
+                X[:, j] -= means[c]
+        if change < tol or len(fe) == 1:
+            return it, True
+    return max_iter, False
+
+
+def _nested(fe_codes, cluster_codes, n_clusters):
+    """True when every level of the fixed effect lies within a single cluster."""
+    c, n = fe_codes
+    pairs = np.unique(c.astype(np.int64) * n_clusters + cluster_codes)
+    return len(pairs) == n
+
+
+def feols(y, X, fe, cluster=None, weights=None, names=None, tol=TOL, max_iter=MAX_ITER, ci_level=95):
+    """
+    OLS (or WLS) of y on X absorbing any number of fixed effects.
+
+    Parameters
+    ----------
+    y : array-like (n,)
+    X : array-like (n,) or (n, k), or DataFrame (column names become row labels)
+    fe : list of array-like
+        One (n,) array per fixed-effect dimension (ids, years, ...).
+    cluster : array-like (n,), list of them, or cluster_vcov.Clustering, optional
+        Cluster variable(s) for CR1 standard errors (multi-way with a list);
+        iid errors otherwise.
+    weights : array-like (n,), optional
+        Observation (analytic) weights.
+    names : list of str, optional
+        Regressor labels.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per regressor with Estimate, SE, t, p, LB CI and UB CI;
+        attrs holds n, n_clusters, df_resid, iterations and converged.
+    """
+    if names is None:
+        names = list(X.columns) if isinstance(X, pd.DataFrame) else None
+    X = np.asarray(X, dtype=np.float64)
+    X = X[:, np.newaxis] if X.ndim == 1 else X
+    n, k = X.shape
+    names = names or [f"x{j}" for j in range(k)]
+
+    Z = np.empty((n, k + 1), dtype=np.float64, order="F")
+    Z[:, 0] = np.asarray(y, dtype=np.float64)
+    Z[:, 1:] = X
+    fe = [codes(f) for f in fe]
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)
+    iterations, converged = demean(Z, fe, w, tol, max_iter)
+    if not converged:
+        warnings.warn(f"fixed-effect demeaning did not converge in {max_iter} iterations (tol={tol}); "
+                      "estimates are from a partially demeaned panel", RuntimeWarning, stacklevel=2)
+
+    yd, Xd = Z[:, 0], Z[:, 1:]
+    Xw = Xd if w is None else Xd * w[:, np.newaxis]
+    XtX_inv = np.linalg.inv(Xw.T @ Xd)
+    beta = XtX_inv @ (Xw.T @ yd)
+    resid = yd - Xd @ beta
+
+    if cluster is not None:
+        cl = as_clustering(cluster)
+        # The one-way subsets come first: 2^d - 1 subsets for d dimensions
+        ways = list(zip(cl.codes, cl.n_clusters))[:(len(cl.codes) + 1).bit_length() - 1]
+        absorbed = sum(levels for c, levels in fe
+                       if not any(_nested((c, levels), cc, g) for cc, g in ways))
+        n_params = k + max(absorbed - (len(fe) - 1), 0)
+        # Small-sample factor with the smallest number of clusters (fixest's cluster.df="min")
+        n_clusters = min(g for _, g in ways)
+        adj = n_clusters / (n_clusters - 1) * (n - 1) / (n - n_params)
+        vcov = adj * XtX_inv @ meat(Xw * resid[:, np.newaxis], cl) @ XtX_inv
+        df_resid = n_clusters - 1
+    else:
+        n_clusters = None
+        n_params = k + sum(levels for _, levels in fe) - (len(fe) - 1)
+        df_resid = n - n_params
+        ssr = resid @ resid if w is None else resid @ (w * resid)
+        vcov = (ssr / df_resid) * XtX_inv
+
+    se = np.sqrt(np.diag(vcov))
+    t = beta / se
+    crit = sps.t.ppf(0.5 + ci_level / 200, df_resid)
+    table = pd.DataFrame({
+        "Estimate": beta, "SE": se, "t": t,
+        "p": 2 * sps.t.sf(np.abs(t), df_resid),
+        "LB CI": beta - crit * se, "UB CI": beta + crit * se,
+    }, index=names)
+    table.attrs.update(n=n, n_clusters=n_clusters, df_resid=df_resid,
+                       iterations=iterations, converged=converged)
+    return table
@@ -0,0 +1,247 @@
+"""
+File: imputation.py
+Purpose: Borusyak-Jaravel-Spiess imputation event study with sparse/segment-sum linear algebra
+
+The imputation estimator fits unit and period fixed effects on the untreated
+observations (never-treated groups, and treated groups before their cohort),
+imputes Y(0) for every treated observation in one vectorized pass and
+averages tau_it = Y_it - Y_it(0) by horizon (time - cohort).
+
+The untreated observations enter only through M, the sparse units x periods
+matrix of their summed weights. The two-way FE normal equations are solved
+exactly by eliminating the unit effects (a diagonal block) and solving the
+dense periods x periods Schur complement, so there is no iteration and the
+cost is O(rows + periods^3). The same solver, fed the unit and period sums of
+the estimand weights instead of the outcome, gives the BJS implicit weights
+v_it = -w_it (a_i + b_t) of the untreated observations for all horizons at
+once; the unit-clustered variance of Borusyak, Jaravel & Spiess (2024,
+Theorem 3) then needs only segment sums of v * residual per unit, which
+cluster_vcov aggregates further when coarser (or multi-way) clusters are given. Residuals
+of treated observations are tau_it minus its cohort x horizon average
+(weighted by v^2). No dense projection or n x n matrix is formed.
+
+Pre-trend coefficients follow the BJS test: a separate two-way FE regression
+on the untreated observations with dummies for the requested relative
+periods, fitted by fe_demean.feols with the same clusters.
+
+Usage:
+    from imputation import did_imputation
+    table = did_imputation(df, outcome="y", group="id", time="year", cohort="first_treat")
+    table.attrs["overall"]    # ATT over all imputed treated observations
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy import stats as sps
+
+from cluster_vcov import cluster_se, clustering
+from fe_demean import codes, feols
+
+# Relative residual norm below which a pre-trend dummy counts as collinear
+COLLINEAR_TOL = 1e-9
+
+
+def _values(data, name, dtype=np.float64):
+    return np.asarray(data[name].to_numpy(), dtype=dtype)
+
+
+def _fe_solver(M):
+    """
+    Solver for the two-way FE normal equations of the untreated observations.
+
+    M[i, t] is the summed weight of untreated observations of unit i in period
+    t. The returned solve(r_units, r_periods) gives (a, b) with
+    a_i m_i + (M b)_i = r_i and (M'a)_t + b_t m_t = r_t; right-hand sides are
+    (units x k) and (periods x k). Units without untreated observations get a = 0.
+    """
+    m_units = np.asarray(M.sum(axis=1)).ravel()
+    m_periods = np.asarray(M.sum(axis=0)).ravel()
+    inv_units = np.divide(1.0, m_units, out=np.zeros_like(m_units), where=m_units > 0)
+    MD = sparse.diags(inv_units) @ M
+    schur = np.diag(m_periods) - (M.T @ MD).toarray()
+
+    def solve(r_units, r_periods):
+        rhs = r_periods - MD.T @ r_units
+        # One FE level is not identified; lstsq picks the minimum-norm solution
+        b = np.linalg.lstsq(schur, rhs, rcond=None)[0]
+        a = inv_units[:, None] * r_units - MD @ b
+        return a, b
+
+    return solve, m_units, m_periods
+
+
+def did_imputation(data, outcome, group, time, cohort, never_treated=0, weights=None,
+                   horizons=None, pretrends=None, cluster=None, ci_level=95):
+    """
+    Imputation event-study estimates with cluster-robust standard errors.
+
+    Parameters
+    ----------
+    data : pandas or polars DataFrame
+        Panel in long format; rows with a missing outcome (or weight) are dropped.
+    outcome, group, time, cohort : str
+        Column names; `cohort` is the first treated period.
+    never_treated : scalar
+        Cohort value of the never-treated groups.
+    weights : str, optional
+        Column of observation weights, used both in the FE fit and to average
+        tau within each horizon (as aweights in did_imputation).
+    horizons : iterable of int, optional
+        Horizons (time - cohort >= 0) to report; all observed ones by default.
+        Horizons without an imputable observation are left out.
+    pretrends : iterable of int, optional
+        Negative relative periods for the pre-trend coefficients. Leads never
+        observed, or collinear with the fixed effects (e.g. all pre-periods
+        at once), are left out; the distant ones are dropped first.
+
+    cluster : str or list of str, optional
+        Cluster variable(s), constant within each group; several give
+        multi-way clustering. Standard errors are clustered by group by default.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per event time (pre-trends, then horizons) with Estimate, SE,
+        t, p, LB CI, UB CI and N (treated observations averaged). attrs holds
+        overall (the same columns for the ATT over every reported horizon),
+        n, n_untreated, n_groups, n_dropped (treated observations that
+        cannot be imputed: their group or period has no untreated observation,
+        or their horizon is not reported) and pretrends (the leads estimated).
+    """
+    y = _values(data, outcome)
+    g = _values(data, cohort)
+    t = _values(data, time)
+    w = np.ones_like(y) if weights is None else _values(data, weights)
+    keep = ~(np.isnan(y) | np.isnan(w))
+    cluster = [cluster] if isinstance(cluster, str) else list(cluster or [])
+    labels = [np.asarray(data[c].to_numpy())[keep] for c in cluster]
+    unit, n_units = codes(np.asarray(data[group].to_numpy())[keep])
+    y, g, t, w = y[keep], g[keep], t[keep], w[keep]
+    period, n_periods = codes(t)
+
+    treated = (g != never_treated) & (t >= g)
+    untreated = ~treated
+    M = sparse.csr_matrix((w[untreated], (unit[untreated], period[untreated])),
+                          shape=(n_units, n_periods))
+    solve, m_units, m_periods = _fe_solver(M)
+
+    # First stage: alpha, lambda on the untreated observations
+    wy = w[untreated] * y[untreated]
+    alpha, lam = solve(np.bincount(unit[untreated], wy, n_units)[:, None],
+                       np.bincount(period[untreated], wy, n_periods)[:, None])
+    alpha, lam = alpha[:, 0], lam[:, 0]
+    resid0 = y[untreated] - alpha[unit[untreated]] - lam[period[untreated]]
+
+    # Imputation: treated observations whose group and period are both identified
+    rel = (t - g).astype(np.int64)
+    if horizons is None:
+        horizons = np.unique(rel[treated])
+    imputable = treated & (m_units[unit] > 0) & (m_periods[period] > 0) & np.isin(rel, list(horizons))
+    n_dropped = int(treated.sum() - imputable.sum())
+    u1, p1, w1, r1 = unit[imputable], period[imputable], w[imputable], rel[imputable]
+    horizons = np.unique(r1).tolist()
+    if not horizons:
+        raise ValueError("no treated observation can be imputed at the requested horizons")
+    tau = y[imputable] - alpha[u1] - lam[p1]
+
+    # Estimand weights: column j < H is horizon j, column H the overall ATT
+    H = len(horizons)
+    col = np.searchsorted(horizons, r1)
+    n_col = np.append(np.bincount(col, w1, H), w1.sum())
+    v1 = np.column_stack([w1 / n_col[col], w1 / n_col[H]])  # horizon weight, overall weight
+
+    def unit_period_sums(values):
+        ru = np.bincount(u1 * H + col, values[:, 0], n_units * H).reshape(n_units, H)
+        rp = np.bincount(p1 * H + col, values[:, 0], n_periods * H).reshape(n_periods, H)
+        ru = np.column_stack([ru, np.bincount(u1, values[:, 1], n_units)])
+        rp = np.column_stack([rp, np.bincount(p1, values[:, 1], n_periods)])
+        return ru, rp
+
+    estimate = np.append(np.bincount(col, v1[:, 0] * tau, H), v1[:, 1] @ tau)
+
+    # Implicit weights of the untreated observations: v0 = -w (a_i + b_t)
+    a, b = solve(*unit_period_sums(v1))
+
+    # Unit scores sum_t v_it * resid_it. Untreated part: the a_i term vanishes
+    # because the FE residuals sum to zero within each unit
+    E = sparse.csr_matrix((w[untreated] * resid0, (unit[untreated], period[untreated])),
+                          shape=(n_units, n_periods))
+    scores = -(E @ b)
+
+    # Treated part: tau minus its cohort x horizon mean, weighted by v^2 (proportional to w^2)
+    cell, n_cells = codes(g[imputable] * (horizons[-1] + 1) + r1)
+    w2 = w1 * w1
+    tau_bar = np.bincount(cell, w2 * tau, n_cells) / np.bincount(cell, w2, n_cells)
+    resid1 = tau - tau_bar[cell]
+    ru, _ = unit_period_sums(v1 * resid1[:, None])
+    scores += ru
+
+    if labels:
+        # Unit scores summed to clusters; labels are constant within a unit
+        unit_labels = []
+        for lab in labels:
+            per_unit = np.empty(n_units, dtype=lab.dtype)
+            per_unit[unit] = lab
+            unit_labels.append(per_unit)
+        se = cluster_se(scores, clustering(*unit_labels))
+    else:
+        se = np.sqrt((scores ** 2).sum(axis=0))
+    z = sps.norm.ppf(0.5 + ci_level / 200)
+    tstat = estimate / se
+    n_obs = np.append(np.bincount(col, minlength=H), len(col))
+    table = pd.DataFrame({
+        "Estimate": estimate, "SE": se, "t": tstat, "p": 2 * sps.norm.sf(np.abs(tstat)),
+        "LB CI": estimate - z * se, "UB CI": estimate + z * se, "N": n_obs,
+    })
+    overall = table.iloc[H].rename("overall")
+    table = table.iloc[:H].set_axis(pd.Index(horizons, name="event_time"))
+
+    ever = g != never_treated
+    leads = [] if pretrends is None else [k for k in sorted(int(k) for k in pretrends)
+                                          if (ever & untreated & (rel == k)).any()]
+    if leads:
+        pre = _pretrends(solve, y, unit, period, w, rel, ever, untreated, leads,
+                         weights is not None, labels, ci_level)
+        leads = [k for k in leads if k not in pre.attrs["collinear"]]
+        table = pd.concat([pre, table])
+        table.index.name = "event_time"
+
+    table.attrs.update(overall=overall, n=len(y), n_untreated=int(untreated.sum()),
+                       n_groups=n_units, n_dropped=n_dropped, pretrends=leads)
+    return table
+
+
+def _pretrends(solve, y, unit, period, w, rel, ever, untreated, leads, weighted, labels, ci_level):
+    """
+    BJS pre-trend coefficients: untreated-sample FE regression on relative-period dummies.
+
+    The outcome and dummies are projected off the fixed effects with the exact
+    solver; feols() then only verifies the projection (one sweep) and supplies
+    the clustered SEs with the fixest degrees of freedom.
+    """
+    u0, p0, w0 = unit[untreated], period[untreated], w[untreated]
+    Z = np.column_stack([y[untreated]] + [(ever & (rel == k))[untreated] for k in leads]).astype(np.float64)
+    n_units, n_periods = unit.max() + 1, period.max() + 1
+    r_units = np.column_stack([np.bincount(u0, w0 * z, n_units) for z in Z.T])
+    r_periods = np.column_stack([np.bincount(p0, w0 * z, n_periods) for z in Z.T])
+    a, b = solve(r_units, r_periods)
+    Z -= a[u0] + b[p0]
+
+    # A full set of leads spans the unit effects of the treated groups; as in
+    # fixest, collinear leads are dropped, keeping those closest to treatment
+    X = Z[:, 1:]
+    gram = X.T @ (X * w0[:, None])
+    kept = []
+    for j in np.argsort(leads)[::-1]:
+        G = gram[np.ix_(kept, kept)]
+        r = gram[j, j] - gram[j, kept] @ np.linalg.solve(G, gram[kept, j]) if kept else gram[j, j]
+        if r > COLLINEAR_TOL * (gram[j, j] + (gram[j, j] == 0)):
+            kept.append(j)
+    kept.sort()
+    fit = feols(Z[:, 0], X[:, kept], fe=[u0, p0], cluster=[lab[untreated] for lab in labels] or u0,
+                weights=w0 if weighted else None,
+                names=[leads[j] for j in kept], ci_level=ci_level)
+    fit["N"] = [int((ever & untreated & (rel == leads[j])).sum()) for j in kept]
+    fit.attrs["collinear"] = [leads[j] for j in range(len(leads)) if j not in kept]
+    return fit
@@ -0,0 +1,213 @@
+"""
+File: mboot_engine.py
+Purpose: Blocked, multi-threaded multiplier bootstrap for Callaway-Sant'Anna inference
+
+Bootstrap draws are W @ IF / n, with W a (draws x units) matrix of Rademacher
+or Mammen multipliers and IF the (units x ATT(g,t)) influence-function
+matrix. W is never materialized: it is generated in fixed tiles of
+DRAW_TILE draws x UNIT_TILE units, each from its own counter-based seed
+(SeedSequence(seed, spawn_key=(draw_tile, unit_tile))), and multiplied into
+the result tile by tile. Draw tiles are spread over a thread pool (NumPy
+releases the GIL for random fills and BLAS), and every draw tile sums its
+unit tiles in the same order, so the draws are bit-identical for any thread
+count or scheduling block. Memory is one weight tile per thread.
+
+mboot() reproduces csdid.utils.mboot.mboot's statistics (IQR-based SE,
+sup-t critical value for uniform bands) and use_with_csdid() makes ATTgt.fit()
+and aggte() use this engine.
+
+Usage:
+    from mboot_engine import multiplier_bootstrap, use_with_csdid
+    bres = multiplier_bootstrap(inf_func, biters=999, seed=1)
+    use_with_csdid()     # then ATTgt(...).fit(est_method='dr') bootstraps here
+    with use_with_csdid():                 # or only within a block
+        ATTgt(...).fit(est_method='dr')
+"""
+
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.stats import norm
+
+import cluster_vcov
+from cluster_vcov import codes
+from thread_budget import available_cpus
+
+# Tile shape of the multiplier matrix; part of the seeding scheme, so changing
+# it changes the draws (block_tiles and n_threads do not)
+DRAW_TILE = 64
+UNIT_TILE = 16384
+
+# Mammen two-point weights: mean 0, variance 1, third moment 1
+_SQRT5 = np.sqrt(5.0)
+MAMMEN_LOW = (1 - _SQRT5) / 2
+MAMMEN_HIGH = (1 + _SQRT5) / 2
+MAMMEN_P_LOW = (_SQRT5 + 1) / (2 * _SQRT5)
+
+
+def _weights(seed, draw_tile, unit_tile, n_draws, n_units, kind):
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(draw_tile, unit_tile))))
+    if kind == "rademacher":
+        bits = rng.integers(0, 2, size=(n_draws, n_units), dtype=np.int8)
+        return (1 - 2 * bits).astype(np.float64)
+    if kind == "mammen":
+        return np.where(rng.random((n_draws, n_units)) < MAMMEN_P_LOW, MAMMEN_LOW, MAMMEN_HIGH)
+    raise ValueError(f"weights must be 'rademacher' or 'mammen', got {kind!r}")
+
+
+def cluster_sums(inf_func, clusters):
+    """Sum influence-function rows within clusters (rows ordered by first appearance)."""
+    return cluster_vcov.cluster_sums(inf_func, *codes(clusters))
+
+
+def multiplier_bootstrap(inf_func, biters=1000, weights="rademacher", seed=None,
+                         n_threads=None, block_tiles=1):
+    """
+    Bootstrap draws W @ inf_func / n of shape (biters, k).
+
+    Parameters
+    ----------
+    inf_func : array (n, k)
+        Influence functions (or cluster sums), one row per unit.
+    biters : int
+        Number of bootstrap draws.
+    weights : {"rademacher", "mammen"}
+        Multiplier distribution.
+    seed : int or None
+        Root seed; None draws one from np.random, so np.random.seed() keeps
+        runs reproducible as in csdid.
+    n_threads : int, optional
+        Worker threads (default: thread_budget.available_cpus()).
+    block_tiles : int
+        Draw tiles handed to a thread at a time (scheduling only).
+    """
+    inf_func = np.asarray(inf_func, dtype=np.float64)
+    if inf_func.ndim == 1:
+        inf_func = inf_func[:, np.newaxis]
+    n, k = inf_func.shape
+    biters = int(biters)
+    if seed is None:
+        seed = int(np.random.randint(0, 2 ** 31 - 1))
+    n_threads = n_threads or available_cpus()
+
+    out = np.empty((biters, k))
+    n_draw_tiles = -(-biters // DRAW_TILE)
+
+    def run(first_tile):
+        for d in range(first_tile, min(first_tile + block_tiles, n_draw_tiles)):
+            lo, hi = d * DRAW_TILE, min((d + 1) * DRAW_TILE, biters)
+            acc = np.zeros((hi - lo, k))
+            for u, start in enumerate(range(0, n, UNIT_TILE)):
+                stop = min(start + UNIT_TILE, n)
+                w = _weights(seed, d, u, DRAW_TILE, stop - start, weights)[: hi - lo]
+                acc += w @ inf_func[start:stop]
+            out[lo:hi] = acc / n
+
+    starts = range(0, n_draw_tiles, block_tiles)
+    if n_threads == 1 or len(starts) == 1:
+        for s in starts:
+            run(s)
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            list(pool.map(run, starts))
+    return out
+
+
+def bootstrap_stats(bres, n, n_clusters=None, alp=0.05):
+    """
+    SE, variance and uniform-band critical value from bootstrap draws.
+
+    Same rules as csdid's mboot: degenerate columns get NaN, the SE is the
+    normalized IQR of the draws, and crit_val is the (1 - alp) quantile of the
+    max |t| over columns.
+    """
+    n_clusters = n if n_clusters is None else n_clusters
+    bres = np.sqrt(n_clusters) * np.asarray(bres)
+    ndg = ~np.isnan(bres.sum(axis=0)) & ((bres ** 2).sum(axis=0) > np.sqrt(np.finfo(float).eps) * 10)
+    se = np.full(ndg.shape, np.nan)
+    good = bres[:, ndg]
+    if good.shape[1] == 0:
+        return {"bres": good, "V": np.nan, "se": se, "crit_val": np.nan}
+
+    V = np.cov(good, rowvar=False)
+    q75, q25 = np.quantile(good, [0.75, 0.25], axis=0, method="inverted_cdf")
+    b_sigma = (q75 - q25) / (norm.ppf(0.75) - norm.ppf(0.25))
+    se[ndg] = b_sigma * np.sqrt(n_clusters) / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b_t = np.max(np.abs(good / b_sigma), axis=1)
+    b_t = b_t[np.isfinite(b_t)]
+    crit_val = np.quantile(b_t, 1 - alp, method="inverted_cdf") if b_t.size else np.nan
+    return {"bres": good, "V": V, "se": se, "crit_val": crit_val}
+
+
+def mboot(inf_func, biters=1000, alp=0.05, clusters=None, weights="rademacher",
+          seed=None, n_threads=None):
+    """Multiplier bootstrap inference for an (n, k) influence-function matrix."""
+    inf_func = np.asarray(inf_func, dtype=np.float64)
+    if inf_func.ndim == 1:
+        inf_func = inf_func[:, np.newaxis]
+    n = inf_func.shape[0]
+    if clusters is not None:
+        inf_func = cluster_sums(inf_func, clusters)
+    bres = multiplier_bootstrap(inf_func, biters, weights=weights, seed=seed, n_threads=n_threads)
+    return bootstrap_stats(bres, n, n_clusters=inf_func.shape[0], alp=alp)
+
+
+def csdid_mboot(inf_func, DIDparams, pl=False, cores=1):
+    """Drop-in replacement for csdid.utils.mboot.mboot with the same arguments and result keys."""
+    data, idname, tname = DIDparams["data"], DIDparams["idname"], DIDparams["tname"]
+    clustervar = DIDparams.get("clustervars")
+    if isinstance(clustervar, (list, tuple)):
+        if len(clustervar) > 1:
+            raise ValueError("Can't handle more than one cluster variable beyond idname.")
+        clustervar = clustervar[0] if clustervar else None
+    if clustervar is not None and clustervar != idname and clustervar not in data.columns:
+        warnings.warn(f"Cluster variable '{clustervar}' not found in data; reporting "
+                      "standard errors that do NOT account for clustering.")
+    if clustervar == idname or (clustervar is not None and clustervar not in data.columns):
+        clustervar = None
+
+    clusters = None
+    if clustervar is not None:
+        if (data.groupby(idname)[clustervar].nunique() > 1).any():
+            raise ValueError(f"Cluster variable '{clustervar}' varies over time within units. "
+                             "Cluster variables must be time-invariant.")
+        first = data[data[tname] == np.sort(data[tname].unique())[0]] if DIDparams.get("panel", True) else data
+        clusters = first[clustervar].to_numpy()
+    return mboot(inf_func, DIDparams["biters"], alp=DIDparams["alp"], clusters=clusters,
+                 n_threads=cores if pl and cores > 1 else None)
+
+
+class _CsdidRoute:
+    """csdid modules switched to csdid_mboot; restore() (or leaving a with block) switches them back."""
+
+    def __init__(self):
+        import csdid.aggte_fnc.compute_aggte as compute_aggte
+        import csdid.aggte_fnc.utils as aggte_utils
+        import csdid.att_gt as att_gt
+
+        self.original = {module: module.mboot for module in (att_gt, compute_aggte, aggte_utils)}
+        for module in self.original:
+            module.mboot = csdid_mboot
+
+    def restore(self):
+        for module, mboot_fn in self.original.items():
+            module.mboot = mboot_fn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.restore()
+        return False
+
+
+def use_with_csdid():
+    """
+    Route csdid's att_gt / aggte bootstrap through csdid_mboot.
+
+    Takes effect immediately; the returned handle's restore() puts csdid's
+    own bootstrap back, and used as a context manager it does so on exit.
+    """
+    return _CsdidRoute()
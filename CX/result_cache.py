@@ -0,0 +1,177 @@
+"""
+File: result_cache.py
+Purpose: Content-addressed on-disk cache of fitted estimator outputs and timings
+
+A spec's result is keyed on the SHA-256 of its dataset file (plus the columns
+loaded), the estimator (module, name and package version, or the hash of its
+source file when it has no installed version), the full keyword arguments and
+the trial settings. Re-running a sweep after changing one config only fits
+that config; every other spec returns its stored output and timing.
+
+Entries are pickles in `.result_cache/`. A hit refreshes the entry's mtime and
+the oldest entries are evicted once the cache exceeds max_bytes (LRU).
+force=True ignores stored entries and re-times every spec, overwriting them.
+Failed fits are never cached.
+
+Usage:
+    from result_cache import ResultCache, dataset_fingerprint
+    cache = ResultCache(force=args.force)
+    result, metrics, error = cache.timed_trials(
+        did_multiplegt_main, dataset=dataset_fingerprint(path, columns),
+        n_trials=3, df=df, outcome="lwage", group="nr", time="year", treatment="union", effects=5)
+    metrics["Cached"]   # True when the fit was skipped
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from pathlib import Path
+
+from data_cache import file_sha256
+from results_store import package_version as installed_version
+from trials import timed_trials
+
+DEFAULT_DIR = Path(__file__).resolve().parent / ".result_cache"
+
+# 2 GB: room for a full sweep of did_multiplegt_dyn result dicts
+MAX_BYTES = 2 << 30
+
+# Arguments that carry the data itself rather than its description
+DATA_ARGS = ("df", "data")
+
+_FINGERPRINTS = {}
+
+
+def dataset_fingerprint(path, columns=None):
+    """SHA-256 of a data file (memoized per mtime/size) plus the columns loaded from it."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    memo = (str(path), stat.st_mtime_ns, stat.st_size)
+    if memo not in _FINGERPRINTS:
+        _FINGERPRINTS[memo] = file_sha256(path)
+    cols = ",".join(columns) if columns is not None else "*"
+    return f"{_FINGERPRINTS[memo]}:{cols}"
+
+
+def estimator_id(func, version=None):
+    """'module.name==version', falling back to a hash of the module's source file."""
+    module = inspect.getmodule(func)
+    name = f"{getattr(module, '__name__', '?')}.{getattr(func, '__qualname__', repr(func))}"
+    if version is None and module is not None:
+        top = module.__name__.split(".")[0]
+        version = installed_version(top, top.replace("_", "-"))
+    if version is None:
+        try:
+            version = "src-" + file_sha256(inspect.getsourcefile(func))[:16]
+        except (TypeError, OSError):
+            version = "unknown"
+    return f"{name}=={version}"
+
+
+def _canonical(value):
+    """JSON-stable form of an argument value (lists kept ordered, dicts sorted)."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def spec_key(dataset, estimator, kwargs, **settings):
+    """Hex key of (dataset fingerprint, estimator id, kwargs, trial settings)."""
+    payload = json.dumps({
+        "dataset": dataset,
+        "estimator": estimator,
+        "kwargs": _canonical({k: v for k, v in kwargs.items() if k not in DATA_ARGS}),
+        "settings": _canonical(settings),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of (result, metrics, error) per spec.
+
+    Parameters
+    ----------
+    cache_dir : str or Path
+        Directory of the pickled entries.
+    max_bytes : int
+        Total size kept after each store; least recently used entries go first.
+    force : bool
+        Skip lookups (re-time everything) but still store the fresh results.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DIR, max_bytes=MAX_BYTES, force=False):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.force = force
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key):
+        """Stored entry for `key` (refreshing its LRU position), or None."""
+        if self.force:
+            return None
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            os.utime(path)
+            return entry
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, entry):
+        """Store an entry atomically, then evict down to max_bytes."""
+        tmp = self._file(key).with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(key))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.cache_dir.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # evicted by another worker
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*.pkl"):
+            path.unlink(missing_ok=True)
+
+    def timed_trials(self, func, dataset, version=None, n_trials=1, warmup=0, profile=None, **kwargs):
+        """
+        trials.timed_trials() behind the cache.
+
+        `dataset` identifies the data passed in kwargs (see dataset_fingerprint).
+        Returns (result, metrics, error); metrics["Cached"] tells whether the
+        stored fit was reused. `profile` does not enter the key, and a reused
+        fit writes no profile.
+        """
+        key = spec_key(dataset, estimator_id(func, version), kwargs, n_trials=n_trials, warmup=warmup)
+        entry = self.get(key)
+        if entry is not None:
+            return entry["result"], {**entry["metrics"], "Cached": True}, None
+
+        result, metrics, error = timed_trials(func, n_trials=n_trials, warmup=warmup, profile=profile,
+                                              **kwargs)
+        if error is None:
+            self.put(key, {"result": result, "metrics": metrics})
+        return result, {**metrics, "Cached": False}, error
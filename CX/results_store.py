@@ -0,0 +1,282 @@
+"""
+File: results_store.py
+Purpose: Append-only SQLite store of benchmark results with regression detection
+
+Every harness run appends its records, tagged with dataset, spec, platform,
+package, package version, machine and run timestamp, instead of rewriting
+one more comparison CSV. Cross-platform pivots and speedups are queries over
+the latest run of each (dataset, spec, platform), and check_regressions()
+compares each spec's latest run with the previous run on the same machine,
+flagging runtime or peak-memory increases beyond a threshold (e.g. after a
+package upgrade).
+
+Legacy per-platform CSVs (runtime_stata.csv, runtime_R_cran.csv, ...) can be
+imported; re-importing an unchanged file is a no-op.
+
+Usage:
+    from results_store import ResultsDB
+    db = ResultsDB("benchmark_results.sqlite")
+    db.record(runtime_df, platform="Python", package="did_multiplegt_dyn")
+    db.import_csv("runtime_stata.csv", platform="Stata", package="did_multiplegt_dyn")
+    db.pivot()                      # latest runtime per spec x platform
+    db.check_regressions(threshold=0.2)
+
+    python results_store.py pivot
+    python results_store.py regressions --threshold 0.2
+"""
+
+import argparse
+import hashlib
+import os
+import platform as _platform
+import sqlite3
+import uuid
+from contextlib import closing, contextmanager
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+
+import pandas as pd
+
+DEFAULT_DB = Path(__file__).resolve().parent / "benchmark_results.sqlite"
+
+# Relative increase that counts as a regression, and the smallest absolute
+# increase worth reporting (seconds, MB) so sub-second noise is not flagged
+REGRESSION_THRESHOLD = 0.2
+MIN_DELTA = {"runtime_sec": 0.05, "peak_rss_mb": 10.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    run_id          TEXT NOT NULL,
+    timestamp       TEXT NOT NULL,
+    dataset         TEXT NOT NULL,
+    spec            TEXT NOT NULL,
+    platform        TEXT NOT NULL,
+    package         TEXT,
+    package_version TEXT,
+    machine         TEXT,
+    runtime_sec     REAL,
+    cpu_sec         REAL,
+    peak_rss_mb     REAL,
+    n_trials        INTEGER,
+    status          TEXT,
+    UNIQUE (run_id, dataset, spec, platform)
+);
+CREATE INDEX IF NOT EXISTS idx_results_spec ON results (dataset, spec, platform, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_package ON results (package, package_version);
+CREATE INDEX IF NOT EXISTS idx_results_machine ON results (machine, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_run ON results (run_id);
+"""
+
+COLUMNS = ["run_id", "timestamp", "dataset", "spec", "platform", "package", "package_version",
+           "machine", "runtime_sec", "cpu_sec", "peak_rss_mb", "n_trials", "status"]
+
+# Record columns used by the harnesses, mapped to store columns
+RECORD_COLUMNS = {
+    "Example": "dataset",
+    "Model": "spec",
+    "Platform": "platform",
+    "Runtime_sec": "runtime_sec",
+    "CPU_sec": "cpu_sec",
+    "Peak_RSS_MB": "peak_rss_mb",
+    "N_trials": "n_trials",
+}
+
+
+def machine_id():
+    """Host name, architecture and CPU count, e.g. 'bench01/x86_64/16cpu'."""
+    return f"{_platform.node()}/{_platform.machine()}/{os.cpu_count()}cpu"
+
+
+def package_version(*distributions):
+    """Installed version of the first distribution found, or None."""
+    for name in distributions:
+        try:
+            return metadata.version(name)
+        except metadata.PackageNotFoundError:
+            continue
+    return None
+
+
+class ResultsDB:
+    """
+    Append-only results store backed by one SQLite file.
+
+    Parameters
+    ----------
+    path : str or Path
+        Database file, created with its schema on first use.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = Path(path)
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path)) as con:
+            with con:  # commit on success
+                yield con
+
+    def record(self, records, platform=None, package=None, package_version=None,
+               machine=None, run_id=None, timestamp=None):
+        """
+        Append harness records (Example, Model, Runtime_sec, ... columns) as one run.
+
+        Missing Platform/Status columns are filled from the arguments and the
+        Error column. Records of reused fits (Cached=True, see result_cache)
+        are not measurements of this run and are left out. Returns the run_id.
+        """
+        df = pd.DataFrame(records).rename(columns=RECORD_COLUMNS)
+        if "Cached" in df:
+            df = df[~df["Cached"].astype("boolean").fillna(False)].drop(columns="Cached")
+        if "status" not in df:
+            df["status"] = "completed"
+            if "Error" in df:
+                failed = df["Error"].notna()
+                df.loc[failed, "status"] = "error: " + df.loc[failed, "Error"].astype(str)
+        if platform is not None or "platform" not in df:
+            df["platform"] = platform
+        df["run_id"] = run_id or uuid.uuid4().hex[:12]
+        df["timestamp"] = timestamp or datetime.now().isoformat(timespec="seconds")
+        df["package"] = package
+        df["package_version"] = package_version
+        df["machine"] = machine or machine_id()
+        for col in COLUMNS:
+            if col not in df:
+                df[col] = None
+
+        rows = df[COLUMNS].astype(object).where(df[COLUMNS].notna(), None).itertuples(index=False, name=None)
+        with self._connect() as con:
+            con.executemany(f"INSERT OR IGNORE INTO results ({', '.join(COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        return df["run_id"].iloc[0] if len(df) else run_id
+
+    def import_csv(self, path, platform, package=None, package_version=None, machine="imported"):
+        """
+        Import a legacy per-platform runtime CSV (Example, Model, Runtime_sec).
+
+        The run is keyed on the file's contents and stamped with its mtime, so
+        importing the same file twice adds nothing.
+        """
+        path = Path(path)
+        content = path.read_bytes()
+        run_id = "csv-" + hashlib.sha256(content + platform.encode()).hexdigest()[:12]
+        timestamp = datetime.fromtimestamp(path.stat().st_mtime).isoformat(timespec="seconds")
+        return self.record(pd.read_csv(path), platform=platform, package=package,
+                           package_version=package_version, machine=machine,
+                           run_id=run_id, timestamp=timestamp)
+
+    def query(self, sql, params=()):
+        """Run a SELECT against the store and return a DataFrame."""
+        with self._connect() as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+    def history(self, dataset=None, spec=None, platform=None):
+        """All stored rows, oldest first, optionally filtered."""
+        where, params = [], []
+        for col, value in [("dataset", dataset), ("spec", spec), ("platform", platform)]:
+            if value is not None:
+                where.append(f"{col} = ?")
+                params.append(value)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        return self.query(f"SELECT * FROM results {clause} ORDER BY timestamp, rowid", params)
+
+    def latest(self, machine=None):
+        """The most recent row of every (dataset, spec, platform)."""
+        clause, params = ("WHERE machine = ?", (machine,)) if machine else ("", ())
+        return self.query(f"""
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY dataset, spec, platform ORDER BY timestamp DESC, rowid DESC) AS rn
+                FROM results {clause}
+            ) WHERE rn = 1
+        """, params).drop(columns="rn")
+
+    def pivot(self, value="runtime_sec", machine=None):
+        """Latest `value` per (dataset, spec) with one column per platform."""
+        latest = self.latest(machine)
+        if latest.empty:
+            return latest
+        return latest.pivot_table(index=["dataset", "spec"], columns="platform",
+                                  values=value, aggfunc="first").reset_index()
+
+    def speedup(self, baseline, other, value="runtime_sec", machine=None):
+        """Per-spec ratio baseline / other of the latest runs (> 1: `other` is faster)."""
+        wide = self.pivot(value, machine)
+        if baseline not in wide or other not in wide:
+            return pd.DataFrame(columns=["dataset", "spec", baseline, other, "speedup"])
+        wide = wide[["dataset", "spec", baseline, other]].dropna()
+        wide["speedup"] = wide[baseline] / wide[other]
+        return wide
+
+    def check_regressions(self, threshold=REGRESSION_THRESHOLD, metrics=("runtime_sec", "peak_rss_mb"),
+                          platform=None):
+        """
+        Specs whose latest run is slower or larger than the previous run on the same machine.
+
+        A metric regresses when latest > previous * (1 + threshold) and the
+        increase exceeds MIN_DELTA. Returns one row per regressed
+        (dataset, spec, platform, machine, metric) with both package versions.
+        """
+        clause, params = ("AND platform = ?", (platform,)) if platform else ("", ())
+        ranked = self.query(f"""
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY dataset, spec, platform, machine ORDER BY timestamp DESC, rowid DESC) AS rn
+            FROM results WHERE status = 'completed' {clause}
+        """, params)
+        keys = ["dataset", "spec", "platform", "machine"]
+        current = ranked[ranked["rn"] == 1].drop(columns="rn")
+        previous = ranked[ranked["rn"] == 2].drop(columns="rn")
+        pairs = current.merge(previous, on=keys, suffixes=("", "_prev"))
+
+        flagged = []
+        for metric in metrics:
+            new, old = pairs[metric], pairs[f"{metric}_prev"]
+            mask = ((new > old * (1 + threshold)) & (new - old > MIN_DELTA.get(metric, 0))).fillna(False)
+            hit = pairs[mask]
+            flagged.append(pd.DataFrame({
+                **{k: hit[k] for k in keys},
+                "metric": metric,
+                "previous": hit[f"{metric}_prev"],
+                "latest": hit[metric],
+                "ratio": hit[metric] / hit[f"{metric}_prev"],
+                "previous_version": hit["package_version_prev"],
+                "latest_version": hit["package_version"],
+                "previous_run": hit["run_id_prev"],
+                "latest_run": hit["run_id"],
+            }))
+        return pd.concat(flagged, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the benchmark results store")
+    parser.add_argument("command", choices=["pivot", "speedup", "regressions", "import"])
+    parser.add_argument("--db", default=str(DEFAULT_DB))
+    parser.add_argument("--value", default="runtime_sec")
+    parser.add_argument("--baseline", help="baseline platform for speedup")
+    parser.add_argument("--other", help="compared platform for speedup")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--csv", help="CSV to import")
+    parser.add_argument("--platform", help="platform of the imported CSV")
+    args = parser.parse_args()
+
+    db = ResultsDB(args.db)
+    if args.command == "pivot":
+        print(db.pivot(args.value).to_string(index=False))
+    elif args.command == "speedup":
+        print(db.speedup(args.baseline, args.other, args.value).to_string(index=False))
+    elif args.command == "import":
+        print(f"Imported run {db.import_csv(args.csv, platform=args.platform)}")
+    else:
+        regressions = db.check_regressions(args.threshold)
+        if regressions.empty:
+            print("No regressions beyond the threshold.")
+        else:
+            print(regressions.to_string(index=False))
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
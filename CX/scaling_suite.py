@@ -0,0 +1,557 @@
+"""
+File: scaling_suite.py
+Purpose: Scaling-curve benchmark on the Wolfers (2006) replication with fitted complexity exponents
+
+Three points (1.7K, 168K, 1.68M rows) cannot tell linear from superlinear
+scaling. This suite sweeps three axes separately, each with every estimator
+run in an isolated child process (bench_executor.run_isolated):
+
+  - units:   geometric grid of replication multipliers (51 * m states, all years)
+  - periods: windows of T consecutive years around the adoption wave, with the
+             number of units held at PERIODS_MULTIPLIER replicas
+  - cohorts: never-treated states plus the k largest adoption cohorts,
+             replicated to roughly the same number of units
+
+For each (platform, estimator, axis) a log-log OLS of runtime and of memory
+(peak RSS above a no-op child started the same way on the same frames) on
+the axis size gives a complexity exponent; exponents fitted on the upper part
+of the grid that exceed 1 by more than SUPERLINEAR_TOL (with the CI above 1)
+are flagged as superlinear. Results from other platforms in the same layout
+can be added with --include.
+
+With --cores, the suite instead sweeps the thread budget: every estimator
+runs at each replication multiplier of --core-multipliers under 1, 2, 4, ...
+cores (bench_executor.run_isolated(threads=k): polars, BLAS, numba and our
+own pools capped at k, CPUs pinned). Speedup is T(k_min) / T(k), parallel
+efficiency speedup * k_min / k, both against the smallest budget swept (one
+core by default), next to the average number of busy cores (CPU / wall time)
+and the pool sizes the child reported.
+
+OUTPUT:
+    scaling_results_Python.csv  - one row per (estimator, axis, grid point)
+    scaling_exponents.csv       - fitted exponents and superlinear flags
+    scaling_curves.png          - log-log runtime and memory curves
+    scaling_cores_Python.csv    - --cores: one row per (estimator, scale, cores) with speedup
+    scaling_cores.png           - --cores: speedup curves against the ideal
+
+Usage:
+    python scaling_suite.py                              # full sweep
+    python scaling_suite.py --axes units --max-multiplier 100 --points 5
+    python scaling_suite.py --fit-only --include scaling_results_R.csv
+    python scaling_suite.py --cores                      # 1, 2, 4, ... up to every core
+    python scaling_suite.py --cores 1 2 4 8 16 --core-multipliers 100 1000
+"""
+
+import argparse
+import gc
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench_executor import run_isolated
+from data_cache import load_dta
+from thread_budget import core_grid
+from wolfers_data import prepare_data, replicated_frames
+
+warnings.filterwarnings('ignore')
+
+DATA_PATH = Path(__file__).resolve().parent.parent / "_data" / "wolfers2006_didtextbook.dta"
+SAVE_PATH = Path(__file__).resolve().parent
+COLUMNS = ['state', 'year', 'cohort', 'udl', 'div_rate', 'stpop']
+
+TIMEOUT_SECONDS = 300
+# Dynamic effects / placebos, capped at half the window on the periods axis
+EFFECTS = 13
+# Replicas used when the periods or cohorts axis is varied
+PERIODS_MULTIPLIER = 100
+# Adoption wave the period windows are centred on
+CENTER_YEAR = 1972
+# An exponent above 1 + SUPERLINEAR_TOL (with its CI above 1) is flagged
+SUPERLINEAR_TOL = 0.15
+# Fraction of the (largest) grid points used for the flagged exponent
+TAIL_FRACTION = 0.5
+MIN_FIT_POINTS = 3
+# Replication multipliers of the core-count sweep
+CORE_MULTIPLIERS = (1, 100, 1000)
+# Speedup at the largest budget above which an estimator counts as using extra cores
+MULTICORE_SPEEDUP = 1.2
+
+
+# =============================================================================
+# Estimators (same specifications as benchmark_wolfers_python.ipynb)
+# =============================================================================
+
+def fit_dcdh(df, df_pl, n_effects):
+    from did_multiplegt_dyn import DidMultiplegtDyn
+    return DidMultiplegtDyn(
+        df=df_pl,
+        outcome='div_rate',
+        group='state',
+        time='year',
+        treatment='udl',
+        effects=n_effects,
+        placebo=n_effects,
+        weight='stpop'
+    ).fit()
+
+
+def fit_csdid(df, df_pl, n_effects):
+    from csdid.att_gt import ATTgt
+    model = ATTgt(
+        data=df,
+        gname='cohort',
+        tname='year',
+        idname='state',
+        yname='div_rate',
+        weights_name='stpop'
+    ).fit(est_method='dr', base_period='universal')
+    model.aggte(typec='dynamic', min_e=-n_effects, max_e=n_effects, na_rm=True)
+    return model
+
+
+def fit_sunab(df, df_pl, n_effects):
+    import pyfixest as pf
+    return pf.event_study(
+        data=df,
+        yname="div_rate",
+        idname="state",
+        tname="year",
+        gname="cohort",
+        estimator="saturated",
+    )
+
+
+def fit_sunab_cells(df, df_pl, n_effects):
+    from sunab_cells import sunab_cells
+    return sunab_cells(df_pl, outcome='div_rate', group='state', time='year', cohort='cohort')
+
+
+def fit_imputation(df, df_pl, n_effects):
+    from imputation import did_imputation
+    return did_imputation(df_pl, outcome='div_rate', group='state', time='year', cohort='cohort',
+                          weights='stpop', horizons=range(0, n_effects), pretrends=range(-n_effects, 0))
+
+
+ESTIMATORS = {
+    'DIDmultiplegtDYN': fit_dcdh,
+    'did-CS': fit_csdid,
+    'fixest-SA': fit_sunab,
+    'SA-cells': fit_sunab_cells,
+    'imputation-BJS': fit_imputation,
+}
+
+
+# =============================================================================
+# Grids
+# =============================================================================
+
+def geometric_grid(low, high, points):
+    """Unique integers on a geometric grid from low to high (inclusive)."""
+    return sorted(set(np.round(np.geomspace(low, high, points)).astype(int).tolist()))
+
+
+def period_window(base, n_periods, center=CENTER_YEAR):
+    """Rows of `base` in the n_periods consecutive years centred on `center`."""
+    first, last = base['year'].min(), base['year'].max()
+    start = int(np.clip(center - n_periods // 2, first, last - n_periods + 1))
+    return base[(base['year'] >= start) & (base['year'] < start + n_periods)]
+
+
+def cohort_subset(base, n_cohorts):
+    """Never-treated states plus the n_cohorts treated cohorts with the most states."""
+    states = base.groupby('cohort')['state'].nunique()
+    treated = states.drop(0, errors='ignore').sort_values(ascending=False, kind='stable')
+    keep = [0] + treated.index[:n_cohorts].tolist()
+    return base[base['cohort'].isin(keep)]
+
+
+def build_points(base, axes, max_multiplier, points):
+    """
+    Yield (axis, size, multiplier, subset) for every grid point.
+
+    `size` is the quantity the exponent is fitted against: units, periods or
+    cohorts.
+    """
+    n_states = base['state'].nunique()
+    if 'units' in axes:
+        for m in geometric_grid(1, max_multiplier, points):
+            yield 'units', n_states * m, m, base
+    if 'periods' in axes:
+        n_years = base['year'].nunique()
+        for t in geometric_grid(4, n_years, points):
+            yield 'periods', t, PERIODS_MULTIPLIER, period_window(base, t)
+    if 'cohorts' in axes:
+        n_treated = base.loc[base['cohort'] != 0, 'cohort'].nunique()
+        target_units = n_states * PERIODS_MULTIPLIER
+        for k in geometric_grid(1, n_treated, points):
+            subset = cohort_subset(base, k)
+            m = max(1, round(target_units / subset['state'].nunique()))
+            yield 'cohorts', k, m, subset
+
+
+# =============================================================================
+# Sweep
+# =============================================================================
+
+def _noop(*args):
+    pass
+
+
+def baseline_rss(*args, timeout_sec=60):
+    """
+    Peak RSS of an isolated no-op call on `args`, subtracted to get estimator memory.
+
+    Pass the same arguments as the estimator run: the child then starts the
+    same way (fork or spawn, see default_start_method) and receives the same
+    copy of the frames, so neither is counted as estimator memory.
+    """
+    return run_isolated(_noop, *args, timeout_sec=timeout_sec)['peak_rss_mb']
+
+
+def run_sweep(base, estimators, axes, max_multiplier, points,
+              timeout_sec=TIMEOUT_SECONDS, mem_limit_mb=None, n_trials=1, warmup=0):
+    """
+    Run every estimator on every grid point and return the results table.
+
+    Once an estimator times out or fails on an axis, the larger points of that
+    axis are recorded as skipped instead of being run.
+    """
+    stopped = set()
+    rows = []
+    for axis, size, multiplier, subset in build_points(base, axes, max_multiplier, points):
+        df, df_pl = replicated_frames(subset, multiplier)
+        n_periods = subset['year'].nunique()
+        n_effects = min(EFFECTS, max(1, n_periods // 2 - 1))
+        print(f"--- {axis} = {size} ({len(df):,} rows) ---")
+        baseline = None
+
+        for name in estimators:
+            row = {
+                'Platform': 'Python',
+                'Estimator': name,
+                'Axis': axis,
+                'Size': size,
+                'Rows': len(df),
+                'Units': df['state'].nunique(),
+                'Periods': n_periods,
+                'Cohorts': subset.loc[subset['cohort'] != 0, 'cohort'].nunique(),
+            }
+            if (name, axis) in stopped:
+                rows.append({**row, 'Runtime_sec': np.nan, 'CPU_sec': np.nan,
+                             'Peak_RSS_MB': np.nan, 'Mem_MB': np.nan, 'Status': 'skipped'})
+                continue
+
+            if baseline is None:
+                baseline = baseline_rss(df, df_pl, n_effects)
+            res = run_isolated(ESTIMATORS[name], df, df_pl, n_effects,
+                               timeout_sec=timeout_sec, mem_limit_mb=mem_limit_mb,
+                               n_trials=n_trials, warmup=warmup)
+            status = res['status']
+            if status != 'completed':
+                stopped.add((name, axis))
+            rows.append({
+                **row,
+                'Runtime_sec': res['time'],
+                'CPU_sec': res['cpu_time'],
+                'Peak_RSS_MB': res['peak_rss_mb'],
+                'Mem_MB': max(res['peak_rss_mb'] - baseline, 0.0),
+                'Status': status,
+            })
+            print(f"  {name}: {res['time']:.2f}s, {res['peak_rss_mb']:.0f} MB peak"
+                  if status == 'completed' else f"  {name}: {status}")
+
+        del df, df_pl
+        gc.collect()
+    return pd.DataFrame(rows)
+
+
+def run_core_sweep(base, estimators, cores, multipliers=CORE_MULTIPLIERS,
+                   timeout_sec=TIMEOUT_SECONDS, mem_limit_mb=None, n_trials=1, warmup=0):
+    """
+    Run every estimator at every multiplier under each thread budget in `cores`.
+
+    Each run is a spawned child with its own budget (see thread_budget), so
+    the budgets do not leak into one another. At least one warm-up call is
+    made: in a fresh interpreter the first call also pays for the lazy
+    imports and pool start-up, which would otherwise dominate small scales.
+    """
+    warmup = max(warmup, 1)
+    rows = []
+    for m in multipliers:
+        df, df_pl = replicated_frames(base, m)
+        print(f"--- {m}x ({len(df):,} rows) ---")
+        for name in estimators:
+            for k in cores:
+                res = run_isolated(ESTIMATORS[name], df, df_pl, EFFECTS,
+                                   timeout_sec=timeout_sec, mem_limit_mb=mem_limit_mb,
+                                   n_trials=n_trials, warmup=warmup, threads=k)
+                rows.append({
+                    'Platform': 'Python',
+                    'Estimator': name,
+                    'Multiplier': m,
+                    'Rows': len(df),
+                    'Threads': k,
+                    'Runtime_sec': res['time'],
+                    'CPU_sec': res['cpu_time'],
+                    'Peak_RSS_MB': res['peak_rss_mb'],
+                    'Status': res['status'],
+                    'CPUs_pinned': res['threads'].get('cpus'),
+                    'Polars_threads': res['threads'].get('polars'),
+                    'BLAS_threads': res['threads'].get('blas'),
+                })
+                print(f"  {name} @ {k} cores: {res['time']:.2f}s wall, {res['cpu_time']:.2f}s CPU"
+                      if res['status'] == 'completed' else f"  {name} @ {k} cores: {res['status']}")
+        del df, df_pl
+        gc.collect()
+    return pd.DataFrame(rows)
+
+
+def parallel_efficiency(results):
+    """
+    Add Speedup, Efficiency and Busy_cores to the core-sweep results.
+
+    Speedup and Efficiency are relative to the smallest completed budget of
+    each (Platform, Estimator, Rows); Busy_cores is CPU_sec / Runtime_sec.
+    """
+    results = results.drop(columns=['Busy_cores', 'Ref_threads', 'Speedup', 'Efficiency'], errors='ignore')
+    results['Busy_cores'] = results['CPU_sec'] / results['Runtime_sec']
+    done = results[results['Status'] == 'completed']
+    ref = (done.sort_values('Threads')
+               .groupby(['Platform', 'Estimator', 'Rows'])[['Threads', 'Runtime_sec']].first()
+               .rename(columns={'Threads': 'Ref_threads', 'Runtime_sec': 'Ref_sec'}))
+    results = results.join(ref, on=['Platform', 'Estimator', 'Rows'])
+    completed = results['Status'] == 'completed'
+    results['Speedup'] = (results['Ref_sec'] / results['Runtime_sec']).where(completed)
+    results['Efficiency'] = results['Speedup'] * results['Ref_threads'] / results['Threads']
+    return results.drop(columns='Ref_sec')
+
+
+def report_cores(results):
+    """Speedup at the largest budget per estimator and scale, with the multi-core flag."""
+    done = results[results['Status'] == 'completed']
+    top = done.loc[done.groupby(['Platform', 'Estimator', 'Rows'])['Threads'].idxmax()]
+    top = top.assign(Uses_extra_cores=top['Speedup'] > MULTICORE_SPEEDUP)
+    print("\n" + "=" * 70)
+    print("CORE SCALING (largest budget against the smallest)")
+    print("=" * 70)
+    print(top[['Platform', 'Estimator', 'Rows', 'Ref_threads', 'Threads', 'Runtime_sec', 'Speedup',
+               'Efficiency', 'Busy_cores', 'Uses_extra_cores']].to_string(index=False, float_format='%.2f'))
+    return top
+
+
+def plot_cores(results, path):
+    """Speedup against the thread budget, one panel per scale, with the ideal line."""
+    import matplotlib.pyplot as plt
+
+    done = results[results['Status'] == 'completed']
+    scales = sorted(done['Rows'].unique())
+    if not scales:
+        return None
+    fig, grid = plt.subplots(1, len(scales), figsize=(5 * len(scales), 4.5), squeeze=False)
+    for ax, rows in zip(grid[0], scales):
+        sub = done[done['Rows'] == rows]
+        for (platform, estimator), group in sub.groupby(['Platform', 'Estimator']):
+            group = group.sort_values('Threads')
+            ax.plot(group['Threads'], group['Speedup'], marker='o', label=f"{estimator} ({platform})")
+        k = np.array(sorted(sub['Threads'].unique()))
+        ax.plot(k, k / k.min(), color='grey', linestyle='--', label='ideal')
+        ax.set_xscale('log', base=2)
+        ax.set_yscale('log', base=2)
+        ax.set_xlabel('Cores')
+        ax.set_ylabel('Speedup')
+        ax.set_title(f"{rows:,} rows")
+        ax.grid(True, which='both', alpha=0.3)
+        ax.legend(fontsize=7)
+
+    plt.suptitle("Wolfers (2006) core scaling (thread budget pinned per run)")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+# =============================================================================
+# Complexity exponents
+# =============================================================================
+
+def loglog_fit(size, value):
+    """OLS of log(value) on log(size): (exponent, standard error, R^2)."""
+    x = np.log(np.asarray(size, dtype=float))
+    y = np.log(np.asarray(value, dtype=float))
+    X = np.column_stack([np.ones_like(x), x])
+    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    resid = y - X @ coef
+    dof = len(x) - 2
+    if dof > 0:
+        sigma2 = resid @ resid / dof
+        se = np.sqrt(sigma2 * np.linalg.inv(X.T @ X)[1, 1])
+    else:
+        se = np.nan
+    ss_tot = ((y - y.mean()) ** 2).sum()
+    r2 = 1 - (resid @ resid) / ss_tot if ss_tot > 0 else np.nan
+    return coef[1], se, r2
+
+
+def fit_exponents(results, tail=TAIL_FRACTION, min_points=MIN_FIT_POINTS, tol=SUPERLINEAR_TOL):
+    """
+    Runtime and memory exponents per (Platform, Estimator, Axis).
+
+    `Exponent` uses every completed grid point; `Tail_exponent` uses the
+    largest `tail` fraction of them (at least `min_points`), where fixed
+    start-up costs no longer flatten the curve, and drives the Superlinear
+    flag: Tail_exponent > 1 + tol with the lower end of its 95% CI above 1.
+    """
+    rows = []
+    done = results[results['Status'] == 'completed']
+    for (platform, estimator, axis), group in done.groupby(['Platform', 'Estimator', 'Axis']):
+        group = group.sort_values('Size')
+        for metric, column in [('runtime', 'Runtime_sec'), ('memory', 'Mem_MB')]:
+            points = group[group[column] > 0]
+            row = {'Platform': platform, 'Estimator': estimator, 'Axis': axis,
+                   'Metric': metric, 'N_points': len(points),
+                   'Size_min': points['Size'].min(), 'Size_max': points['Size'].max()}
+            if points['Size'].nunique() < min_points:
+                rows.append({**row, 'Exponent': np.nan, 'Exponent_se': np.nan, 'R2': np.nan,
+                             'Tail_exponent': np.nan, 'Tail_se': np.nan, 'Superlinear': False})
+                continue
+            slope, se, r2 = loglog_fit(points['Size'], points[column])
+            n_tail = max(min_points, int(np.ceil(tail * len(points))))
+            tail_points = points.tail(n_tail)
+            tail_slope, tail_se, _ = loglog_fit(tail_points['Size'], tail_points[column])
+            superlinear = bool(tail_slope > 1 + tol and
+                               (np.isnan(tail_se) or tail_slope - 1.96 * tail_se > 1))
+            rows.append({**row, 'Exponent': slope, 'Exponent_se': se, 'R2': r2,
+                         'Tail_exponent': tail_slope, 'Tail_se': tail_se,
+                         'Superlinear': superlinear})
+    return pd.DataFrame(rows)
+
+
+def plot_curves(results, exponents, path):
+    """Log-log runtime and memory curves, one column per axis."""
+    import matplotlib.pyplot as plt
+
+    done = results[results['Status'] == 'completed']
+    axes_present = [a for a in ['units', 'periods', 'cohorts'] if a in set(done['Axis'])]
+    if not axes_present:
+        return None
+    fig, grid = plt.subplots(2, len(axes_present), figsize=(5 * len(axes_present), 8), squeeze=False)
+    labels = {'units': 'Units (states)', 'periods': 'Periods (years)', 'cohorts': 'Treated cohorts'}
+
+    for j, axis in enumerate(axes_present):
+        for i, (metric, column, ylabel) in enumerate([('runtime', 'Runtime_sec', 'Runtime (seconds)'),
+                                                      ('memory', 'Mem_MB', 'Peak memory above baseline (MB)')]):
+            ax = grid[i, j]
+            for (platform, estimator), group in done[done['Axis'] == axis].groupby(['Platform', 'Estimator']):
+                group = group[group[column] > 0].sort_values('Size')
+                fit = exponents[(exponents['Platform'] == platform) & (exponents['Estimator'] == estimator) &
+                                (exponents['Axis'] == axis) & (exponents['Metric'] == metric)]
+                label = f"{estimator} ({platform})"
+                if len(fit) and not np.isnan(fit['Exponent'].iloc[0]):
+                    flag = ' !' if fit['Superlinear'].iloc[0] else ''
+                    label += f", b={fit['Exponent'].iloc[0]:.2f}{flag}"
+                ax.plot(group['Size'], group[column], marker='o', label=label)
+            ax.set_xscale('log')
+            ax.set_yscale('log')
+            ax.set_xlabel(labels[axis])
+            ax.set_ylabel(ylabel)
+            ax.grid(True, which='both', alpha=0.3)
+            ax.legend(fontsize=7)
+            if i == 0:
+                ax.set_title(f"Scaling in {labels[axis].lower()}")
+
+    plt.suptitle("Wolfers (2006) scaling curves (b = log-log exponent, ! = superlinear)")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def report(exponents):
+    flagged = exponents[exponents['Superlinear']]
+    print("\n" + "=" * 70)
+    print("COMPLEXITY EXPONENTS")
+    print("=" * 70)
+    print(exponents[['Platform', 'Estimator', 'Axis', 'Metric', 'N_points',
+                     'Exponent', 'Tail_exponent', 'Superlinear']].to_string(index=False))
+    if len(flagged):
+        print("\nSuperlinear scaling detected:")
+        for _, r in flagged.iterrows():
+            print(f"  {r['Estimator']} ({r['Platform']}): {r['Metric']} ~ {r['Axis']}^{r['Tail_exponent']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--axes", nargs="+", default=["units", "periods", "cohorts"],
+                        choices=["units", "periods", "cohorts"])
+    parser.add_argument("--estimators", nargs="+", default=list(ESTIMATORS), choices=list(ESTIMATORS))
+    parser.add_argument("--max-multiplier", type=int, default=1000,
+                        help="largest replication multiplier on the units axis (default: 1000)")
+    parser.add_argument("--points", type=int, default=8,
+                        help="grid points per axis (default: 8)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_SECONDS)
+    parser.add_argument("--memory-limit", type=float, default=None, help="address-space cap per run in MB")
+    parser.add_argument("--trials", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--include", nargs="*", default=[],
+                        help="scaling results CSVs from other platforms to fit alongside")
+    parser.add_argument("--fit-only", action="store_true",
+                        help="refit exponents from existing scaling_results_*.csv without running")
+    parser.add_argument("--cores", nargs="*", type=int, default=None,
+                        help="sweep these thread budgets instead of the axes "
+                             "(no value: 1, 2, 4, ... up to every available core)")
+    parser.add_argument("--core-multipliers", nargs="+", type=int, default=list(CORE_MULTIPLIERS),
+                        help=f"replication multipliers of the core sweep (default: {CORE_MULTIPLIERS})")
+    args = parser.parse_args()
+
+    if args.cores is not None:
+        run_cores(args)
+        return
+
+    results_path = SAVE_PATH / "scaling_results_Python.csv"
+    if args.fit_only:
+        results = pd.read_csv(results_path)
+    else:
+        base = prepare_data(load_dta(DATA_PATH, reader='pyreadstat', columns=COLUMNS))
+        results = run_sweep(base, args.estimators, args.axes, args.max_multiplier, args.points,
+                            timeout_sec=args.timeout, mem_limit_mb=args.memory_limit,
+                            n_trials=args.trials, warmup=args.warmup)
+        results.to_csv(results_path, index=False)
+        print(f"\nResults saved to: {results_path}")
+
+    if args.include:
+        results = pd.concat([results] + [pd.read_csv(p) for p in args.include], ignore_index=True)
+
+    exponents = fit_exponents(results)
+    exponents.to_csv(SAVE_PATH / "scaling_exponents.csv", index=False)
+    report(exponents)
+    plot_curves(results, exponents, SAVE_PATH / "scaling_curves.png")
+    print(f"\nExponents saved to: {SAVE_PATH / 'scaling_exponents.csv'}")
+    print(f"Plot saved to: {SAVE_PATH / 'scaling_curves.png'}")
+
+
+def run_cores(args):
+    """--cores mode of main()."""
+    results_path = SAVE_PATH / "scaling_cores_Python.csv"
+    if args.fit_only:
+        results = pd.read_csv(results_path)
+    else:
+        base = prepare_data(load_dta(DATA_PATH, reader='pyreadstat', columns=COLUMNS))
+        results = run_core_sweep(base, args.estimators, sorted(set(args.cores or core_grid())),
+                                 args.core_multipliers, timeout_sec=args.timeout,
+                                 mem_limit_mb=args.memory_limit, n_trials=args.trials, warmup=args.warmup)
+        parallel_efficiency(results).to_csv(results_path, index=False)
+        print(f"\nResults saved to: {results_path}")
+
+    if args.include:
+        results = pd.concat([results] + [pd.read_csv(p) for p in args.include], ignore_index=True)
+
+    results = parallel_efficiency(results)
+    report_cores(results)
+    plot_cores(results, SAVE_PATH / "scaling_cores.png")
+    print(f"Plot saved to: {SAVE_PATH / 'scaling_cores.png'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+File: sim_panel.py
+Purpose: Chunked, seed-stable Python generator for the staggered-adoption simulation panel
+
+Implements the DGP of data_generation.qmd without the R round-trip:
+
+    Y_it   = 2 + alpha_i + lambda_t + tau_gt * D_it + eps_it
+    tau_gt = TAU_0 + delta_g + GAMMA * (t - g)
+
+with cohorts 2012/2014/2016/2018/never drawn with COHORT_PROBS, alpha_i and
+eps_it standard normal and lambda_t evenly spaced on [-0.2, 0.2].
+
+Units are generated in fixed blocks of BLOCK_UNITS. Each block draws from its
+own counter-based stream, SeedSequence(seed, spawn_key=(block,)), in a fixed
+order (cohort uniforms, unit effects, then the units x periods errors), so a
+block's rows depend only on the seed and the block index. Parquet parts are
+runs of whole blocks written by a process pool; the panel is therefore
+bit-identical for a given seed whatever blocks_per_part or the number of
+workers. Columns use data_cache.SIM_DATA_TYPES (id, year, y, first_treat,
+treated), so a part loads exactly like the cached sim_data.csv. The panel
+matches the R design in distribution, not draw for draw (R's RNG is not
+reproduced), so the cross-language chapters keep reading sim_data.csv.
+
+Usage:
+    from sim_panel import generate, write_parquet
+    table = generate(10_000, seed=20240115)             # pyarrow.Table in memory
+    write_parquet("sim_10m", n_units=10_000_000)        # sim_10m/part-000000.parquet, ...
+    df_pl = pl.scan_parquet("sim_10m/*.parquet")
+
+    python sim_panel.py --units 100000000 --out sim_100m --workers 16
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_cache import SIM_DATA_TYPES
+from thread_budget import available_cpus
+
+SEED = 20240115
+N_UNITS = 10_000
+N_PERIODS = 10
+BASE_YEAR = 2010
+
+TREAT_COHORTS = (0, 2012, 2014, 2016, 2018)  # 0 = never treated
+COHORT_PROBS = (0.30, 0.20, 0.20, 0.20, 0.10)
+COHORT_EFFECTS = (0.0, 0.5, 0.3, 0.1, 0.0)   # delta_g
+TAU_0 = 1.0
+GAMMA = 0.1
+INTERCEPT = 2.0
+
+# Units per seeding block; part of the seeding scheme, so changing it changes
+# the draws (blocks_per_part and workers do not)
+BLOCK_UNITS = 1 << 16
+
+
+def _n_blocks(n_units):
+    return -(-n_units // BLOCK_UNITS)
+
+
+def generate_block(block, n_units=N_UNITS, seed=SEED, n_periods=N_PERIODS, truth=False):
+    """
+    Rows of one seeding block (units block*BLOCK_UNITS+1 ...), sorted by id and year.
+
+    truth=True adds tau_gt, the true effect of each row (0 when untreated).
+    """
+    first = block * BLOCK_UNITS
+    n = min(BLOCK_UNITS, n_units - first)
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(block,))))
+    cohort_draw = rng.random(n)
+    unit_fe = rng.standard_normal(n)
+    eps = rng.standard_normal((n, n_periods))
+
+    # Inverse-CDF draw of the cohort (stable across NumPy versions, unlike choice())
+    k = np.minimum(np.searchsorted(np.cumsum(COHORT_PROBS), cohort_draw, side="right"),
+                   len(TREAT_COHORTS) - 1)
+    g = np.asarray(TREAT_COHORTS, dtype=np.int16)[k]
+    delta = np.asarray(COHORT_EFFECTS)[k]
+
+    years = np.arange(BASE_YEAR, BASE_YEAR + n_periods, dtype=np.int16)
+    time_fe = np.linspace(-0.2, 0.2, n_periods)
+    treated = (g[:, None] > 0) & (years[None, :] >= g[:, None])
+    tau = np.where(treated, TAU_0 + delta[:, None] + GAMMA * (years[None, :] - g[:, None]), 0.0)
+    y = INTERCEPT + unit_fe[:, None] + time_fe[None, :] + tau + eps
+
+    id_type = SIM_DATA_TYPES["id"] if n_units < np.iinfo(np.int32).max else pa.int64()
+    columns = {
+        "id": pa.array(np.repeat(np.arange(first + 1, first + n + 1), n_periods), type=id_type),
+        "year": pa.array(np.tile(years, n), type=SIM_DATA_TYPES["year"]),
+        "y": pa.array(y.ravel(), type=SIM_DATA_TYPES["y"]),
+        "first_treat": pa.array(np.repeat(g, n_periods), type=SIM_DATA_TYPES["first_treat"]),
+        "treated": pa.array(treated.ravel(), type=SIM_DATA_TYPES["treated"]),
+    }
+    if truth:
+        columns["tau_gt"] = pa.array(tau.ravel())
+    return pa.table(columns)
+
+
+def generate(n_units=N_UNITS, seed=SEED, n_periods=N_PERIODS, truth=False):
+    """The whole panel as one in-memory pyarrow.Table (for sizes that fit in RAM)."""
+    return pa.concat_tables([generate_block(b, n_units, seed, n_periods, truth)
+                             for b in range(_n_blocks(n_units))])
+
+
+def _write_part(path, blocks, n_units, seed, n_periods, truth):
+    """Worker entry point: generate a run of blocks and write them as one Parquet file."""
+    writer = None
+    try:
+        for b in blocks:
+            table = generate_block(b, n_units, seed, n_periods, truth)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def write_parquet(out_dir, n_units=N_UNITS, seed=SEED, n_periods=N_PERIODS, truth=False,
+                  blocks_per_part=16, max_workers=None):
+    """
+    Write the panel as Parquet parts, one per run of blocks_per_part blocks.
+
+    Parts are named part-<first block>.parquet, so reading them in name order
+    gives the panel sorted by id and year. Each block is one row group.
+
+    Parameters
+    ----------
+    out_dir : str or Path
+        Output directory (created). Parts left by an earlier call are removed
+        first, so a directory read as a dataset holds only this panel.
+    blocks_per_part : int
+        Seeding blocks (BLOCK_UNITS units each) per file and per task.
+    max_workers : int, optional
+        Pool size. Defaults to min(number of parts, thread_budget.available_cpus()).
+
+    Returns
+    -------
+    list of str
+        Part paths in order.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for stale in out_dir.glob("part-*.parquet"):
+        stale.unlink()
+    n_blocks = _n_blocks(n_units)
+    tasks = [(str(out_dir / f"part-{start:06d}.parquet"), range(start, min(start + blocks_per_part, n_blocks)))
+             for start in range(0, n_blocks, blocks_per_part)]
+    if max_workers is None:
+        max_workers = min(len(tasks), available_cpus())
+
+    if max_workers == 1:
+        return [_write_part(path, blocks, n_units, seed, n_periods, truth) for path, blocks in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_write_part, path, blocks, n_units, seed, n_periods, truth)
+                   for path, blocks in tasks]
+        return [f.result() for f in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--units", type=int, default=N_UNITS)
+    parser.add_argument("--periods", type=int, default=N_PERIODS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", default="sim_panel", help="output directory of the Parquet parts")
+    parser.add_argument("--blocks-per-part", type=int, default=16,
+                        help=f"seeding blocks of {BLOCK_UNITS} units per file (default: 16)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--truth", action="store_true", help="also write the true effect tau_gt")
+    args = parser.parse_args()
+
+    parts = write_parquet(args.out, args.units, args.seed, args.periods, args.truth,
+                          args.blocks_per_part, args.workers)
+    print(f"{args.units:,} units x {args.periods} periods written to {args.out}/ ({len(parts)} parts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+File: spec_pool.py
+Purpose: Process-pool runner for independent did_multiplegt_dyn specifications
+
+Every (dataset, config) pair of the benchmark sweep is independent, so each
+one is shipped to a worker process. Workers import the estimator once, load
+each dataset at most once (cached per process) and report wall time, CPU
+time and peak RSS per spec, using the same record layout as the serial
+harness so the runtime CSV stays comparable. With a result_cache.ResultCache,
+specs whose data, arguments and estimator are unchanged are not re-fitted.
+
+Usage:
+    from spec_pool import run_specs_parallel
+    records = run_specs_parallel(specs, estimator=("did_multiplegt_main", "did_multiplegt_main"))
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from result_cache import dataset_fingerprint
+from thread_budget import available_cpus
+from trials import timed_trials
+
+
+# Per-process state, filled by _init_worker
+_ESTIMATOR = None
+_DATASETS = {}
+
+
+def import_estimator(candidates, extra_paths=()):
+    """Import the first available (module, attribute) pair from candidates."""
+    for path in extra_paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    errors = []
+    for module_name, attr in candidates:
+        try:
+            module = __import__(module_name, fromlist=[attr])
+            return getattr(module, attr)
+        except (ImportError, AttributeError) as e:
+            errors.append(f"{module_name}.{attr}: {e}")
+    raise ImportError("Could not import estimator: " + "; ".join(errors))
+
+
+def _init_worker(candidates, extra_paths):
+    global _ESTIMATOR
+    _ESTIMATOR = import_estimator(candidates, extra_paths)
+
+
+def _get_dataset(spec, loader):
+    """Load a dataset once per worker process."""
+    path = spec["path"]
+    if path not in _DATASETS:
+        if "columns" in spec:
+            _DATASETS[path] = loader(path, spec["columns"])
+        else:
+            _DATASETS[path] = loader(path)
+    return _DATASETS[path]
+
+
+def _run_spec(spec, loader, cache=None):
+    """
+    Worker entry point: fit one spec and return its runtime record.
+
+    A dataset that cannot be loaded gives an error record for this spec
+    instead of aborting the sweep.
+    """
+    try:
+        df = _get_dataset(spec, loader)
+    except Exception as e:
+        return {"Example": spec["example"], "Model": spec["model"],
+                "Runtime_sec": float("nan"), "CPU_sec": float("nan"), "Peak_RSS_MB": float("nan"),
+                "Platform": "Python", "Error": f"loading {spec['path']}: {e}",
+                "Worker_PID": os.getpid()}
+    fit_kwargs = dict(df=df, outcome=spec["outcome"], group=spec["group"], time=spec["time"],
+                      treatment=spec["treatment"], **spec.get("kwargs", {}))
+    trials = dict(n_trials=spec.get("n_trials", 1), warmup=spec.get("warmup", 0),
+                  profile=spec.get("profile"))
+    if cache is None:
+        _, metrics, error = timed_trials(_ESTIMATOR, **trials, **fit_kwargs)
+    else:
+        dataset = dataset_fingerprint(spec["path"], spec.get("columns"))
+        _, metrics, error = cache.timed_trials(_ESTIMATOR, dataset=dataset, **trials, **fit_kwargs)
+    return {
+        "Example": spec["example"],
+        "Model": spec["model"],
+        **metrics,
+        "Platform": "Python",
+        "Error": error,
+        "Worker_PID": os.getpid(),
+    }
+
+
+def run_specs_parallel(specs, estimator, extra_paths=(), loader=pd.read_stata, max_workers=None,
+                       cache=None):
+    """
+    Run independent estimation specs in a process pool.
+
+    Parameters
+    ----------
+    specs : list of dict
+        Each spec has keys example, model, path, outcome, group, time,
+        treatment and optionally kwargs (extra estimator arguments),
+        columns (passed to the loader as its second argument),
+        n_trials / warmup and profile (see trials.timed_trials).
+    estimator : tuple or list of tuples
+        (module, attribute) candidates for the estimator, tried in order.
+    extra_paths : sequence of str
+        Entries prepended to sys.path in each worker before importing.
+    loader : callable
+        Module-level function mapping a dataset path to a DataFrame.
+    max_workers : int, optional
+        Pool size. Defaults to min(len(specs), thread_budget.available_cpus()).
+    cache : result_cache.ResultCache, optional
+        Reuse stored fits of unchanged specs (records then carry Cached=True).
+
+    Returns
+    -------
+    list of dict
+        Runtime records in the order of specs.
+    """
+    if not specs:
+        return []
+    if isinstance(estimator[0], str):
+        estimator = [estimator]
+    if max_workers is None:
+        max_workers = min(len(specs), available_cpus())
+
+    records = [None] * len(specs)
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(list(estimator), list(extra_paths)),
+    ) as pool:
+        futures = {pool.submit(_run_spec, spec, loader, cache): i for i, spec in enumerate(specs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            record = future.result()
+            records[i] = record
+            print(f"--- {record['Example']} : {record['Model']} --- "
+                  f"{record['Runtime_sec']:.4f}s wall, {record['CPU_sec']:.4f}s CPU, "
+                  f"{record['Peak_RSS_MB']:.1f} MB peak (pid {record['Worker_PID']})"
+                  + (" [cached]" if record.get("Cached") else ""))
+            if record["Error"]:
+                print(f"Error: {record['Error']}")
+    return records
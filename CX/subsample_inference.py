@@ -0,0 +1,435 @@
+"""
+File: subsample_inference.py
+Purpose: Full-panel point estimates with bag-of-little-bootstraps or m-out-of-n subsample SEs
+
+For panels of tens of millions of units the point estimates of the DiD
+estimators are cheap next to their variance (influence-function matrices,
+bootstrap draws over every unit, the 300 s timeouts of the scaling runs).
+subsample_se() fits the estimator once on the full panel for the point
+estimates and takes the standard errors from fits on small sets of units,
+resampling whole units so that the within-unit dependence is kept:
+
+- "blb" (Kleiner, Talwalkar, Sarkar & Jordan 2014): n_subsets sets of
+  b = n^gamma units; within each, n_resamples multinomial(n, 1/b) unit
+  counts are passed to the estimator as frequency weights, so each resample
+  mimics a size-n bootstrap sample while touching only b units. The SE is
+  the average over sets of the within-set bootstrap SE. Needs an estimator
+  with a `weights` column argument (imputation.did_imputation, csdid_table).
+- "subsample" (Politis, Romano & Wolf 1999): n_subsets sets of m = n^gamma
+  units drawn without replacement, fitted unweighted; for a root-n
+  estimator Var(theta_n) = m / (n - m) * mean (theta_m - theta_n)^2.
+  Works with any estimator (dcdh_stream, fe_demean.feols wrappers).
+
+Each set is one task of a pool of spawned processes, which receives only that
+set's rows.
+Set j draws from SeedSequence(seed, spawn_key=(j,)), so the SEs depend on
+the seed only, not on the number of workers.
+
+compare_se() sets a mode against the analytical SEs of the same fit: the SE
+ratio, and the coverage it implies for a nominal CI if the analytical SE were
+the true one (a consequence of the ratio, not a check). coverage() is the
+check: it fits the estimator on replicate panels from sim_panel, whose true
+effects are known, and counts how often the subsample and the analytical CIs
+cover them.
+
+Usage:
+    from functools import partial
+    from imputation import did_imputation
+    from subsample_inference import subsample_se, compare_se, coverage
+    fit = partial(did_imputation, outcome="y", group="id", time="year", cohort="first_treat")
+    table = subsample_se(df, "id", fit, method="blb")          # Estimate, SE, LB CI, UB CI
+    compare_se(fit(df), table)
+    coverage(fit, n_reps=50, n_units=2000)                     # empirical coverage
+
+    python subsample_inference.py --data ../sim_data.csv --estimator imputation --method blb
+    python subsample_inference.py --replicates 50 --units 2000
+"""
+
+import argparse
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sps
+
+import sim_panel
+from cluster_vcov import codes
+from thread_budget import available_cpus
+
+METHODS = ("blb", "subsample")
+SEED = 20240115
+# Units per set: n ** GAMMA (Kleiner et al. recommend 0.6 - 0.8 for BLB)
+GAMMA = 0.7
+# Sets per method: BLB averages SEs (few sets suffice), subsampling estimates
+# a variance from the spread of the set estimates
+N_SUBSETS = {"blb": 10, "subsample": 100}
+N_RESAMPLES = 50
+# Frequency-weight column added to each BLB resample
+WEIGHT_COLUMN = "_blb_weight"
+
+
+def _column(data, name):
+    return np.asarray(data[name].to_numpy())
+
+
+def _take(data, rows):
+    """Rows of a pandas/polars DataFrame or pyarrow Table, in the given order."""
+    if hasattr(data, "iloc"):
+        return data.iloc[rows]
+    if hasattr(data, "take"):
+        return data.take(rows)
+    return data[rows]
+
+
+def _with_column(data, name, values):
+    if hasattr(data, "iloc"):
+        return data.assign(**{name: values})
+    if hasattr(data, "with_columns"):
+        import polars as pl
+        return data.with_columns(pl.Series(name, values))
+    return data.append_column(name, [values])
+
+
+def _unit_rows(data, unit):
+    """
+    Unit code of every row (units in order of first appearance), the rows
+    grouped by unit and each unit's offset in that grouping.
+    """
+    code, n_units = codes(_column(data, unit))
+    order = np.argsort(code, kind="stable")
+    starts = np.zeros(n_units + 1, dtype=np.int64)
+    np.cumsum(np.bincount(code, minlength=n_units), out=starts[1:])
+    return code, order, starts
+
+
+def _rows_of(units, order, starts):
+    """Original row indices of the given units, in original row order."""
+    lengths = starts[units + 1] - starts[units]
+    offsets = np.repeat(starts[units] - np.cumsum(lengths) + lengths, lengths)
+    return np.sort(order[offsets + np.arange(lengths.sum())])
+
+
+def _params(result, index, column="Estimate"):
+    """A column of a result table (rows aligned on index) followed by its overall value, if any."""
+    if isinstance(result, pd.Series):
+        return result.reindex(index).to_numpy(dtype=np.float64)
+    values = result[column].reindex(index).to_numpy(dtype=np.float64)
+    overall = result.attrs.get("overall")
+    return values if overall is None else np.append(values, overall[column])
+
+
+def _fit_set(estimator, data, seed, index, method, n_units, n_resamples, unit):
+    """
+    Worker entry point: the statistic of one set of units.
+
+    "subsample": the estimates on the set. "blb": the bootstrap SE of the
+    estimates over n_resamples multinomial reweightings of the set.
+    """
+    if method == "subsample":
+        return _params(estimator(data), index)
+    rng = np.random.Generator(np.random.PCG64(seed))
+    code, order, starts = _unit_rows(data, unit)
+    b = len(starts) - 1
+    draws = []
+    for _ in range(n_resamples):
+        counts = rng.multinomial(n_units, np.full(b, 1.0 / b))
+        # Units drawn zero times are dropped rather than given weight 0
+        rows = _rows_of(np.flatnonzero(counts), order, starts)
+        sample = _with_column(_take(data, rows), WEIGHT_COLUMN, counts[code[rows]].astype(np.float64))
+        draws.append(_params(estimator(sample, weights=WEIGHT_COLUMN), index))
+    return np.nanstd(np.vstack(draws), axis=0, ddof=1)
+
+
+def subsample_se(data, unit, estimator, method="blb", gamma=GAMMA, n_subsets=None,
+                 n_resamples=N_RESAMPLES, subset_size=None, seed=SEED, ci_level=95, max_workers=None,
+                 full=None):
+    """
+    Point estimates on the full panel, standard errors from sets of units.
+
+    Parameters
+    ----------
+    data : pandas or polars DataFrame, or pyarrow.Table
+        Panel in long format.
+    unit : str
+        Unit column; units are resampled whole.
+    estimator : callable
+        estimator(data) -> table with an Estimate column (and optionally
+        attrs["overall"]), or a Series of estimates. For "blb" it is also
+        called as estimator(data, weights=<column>) with frequency weights.
+        Must be picklable (a module-level function or functools.partial).
+    method : {"blb", "subsample"}
+    gamma : float
+        Units per set are n ** gamma, unless subset_size is given.
+    n_subsets : int, optional
+        Sets of units (pool tasks); N_SUBSETS[method] by default.
+    n_resamples : int
+        Multinomial resamples per set ("blb" only).
+    seed : int
+        Root seed; set j uses SeedSequence(seed, spawn_key=(j,)).
+    max_workers : int, optional
+        Pool size. Defaults to min(n_subsets, thread_budget.available_cpus());
+        1 runs the sets in this process.
+    full : table, optional
+        Result of estimator(data), when already computed.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the full-panel table with Estimate, SE, LB CI and UB CI.
+        attrs holds overall (when the estimator reports one), method, n_units,
+        subset_size, n_subsets, n_resamples, draws (per-set estimates or BLB
+        SEs, one row per set) and time (seconds for the sets).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    n_subsets = n_subsets or N_SUBSETS[method]
+    if full is None:
+        full = estimator(data)
+    index = full.index
+    theta = _params(full, index)
+
+    _, order, starts = _unit_rows(data, unit)
+    n_units = len(starts) - 1
+    size = min(int(subset_size or round(n_units ** gamma)), n_units - 1)
+    if size < 2:
+        raise ValueError("the panel has too few units to subsample")
+
+    tasks = []
+    for j in range(n_subsets):
+        seq = np.random.SeedSequence(seed, spawn_key=(j,))
+        units = np.random.Generator(np.random.PCG64(seq)).choice(n_units, size, replace=False)
+        rows = _rows_of(units, order, starts)
+        # The resampling stream of the set is a child of the set's own seed
+        tasks.append((_take(data, rows), seq.spawn(1)[0]))
+
+    fit = partial(_fit_set, estimator, index=index, method=method, n_units=n_units,
+                  n_resamples=n_resamples, unit=unit)
+    max_workers = max_workers or min(n_subsets, available_cpus())
+    start = time.perf_counter()
+    if max_workers == 1:
+        draws = [fit(d, s) for d, s in tasks]
+    else:
+        # Spawned workers: a fork after polars has started its thread pool can deadlock
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")) as pool:
+            draws = list(pool.map(fit, *zip(*tasks)))
+    elapsed = time.perf_counter() - start
+    draws = np.vstack(draws)
+
+    if method == "blb":
+        se = np.nanmean(draws, axis=0)
+    else:
+        se = np.sqrt(size / (n_units - size) * np.nanmean((draws - theta) ** 2, axis=0))
+
+    z = sps.norm.ppf(0.5 + ci_level / 200)
+    table = pd.DataFrame({"Estimate": theta, "SE": se, "LB CI": theta - z * se, "UB CI": theta + z * se})
+    attrs = dict(method=method, n_units=n_units, subset_size=size, n_subsets=n_subsets,
+                 n_resamples=n_resamples if method == "blb" else None, draws=draws, time=elapsed)
+    if len(theta) > len(index):
+        attrs["overall"] = table.iloc[-1].rename("overall")
+        table = table.iloc[:-1]
+    table = table.set_axis(index)
+    table.attrs.update(attrs)
+    return table
+
+
+def compare_se(analytic, inference, ci_level=95):
+    """
+    Subsample SEs against the analytical SEs of the same estimates.
+
+    Returns
+    -------
+    pandas.DataFrame
+        SE_analytic, SE_inference, SE_ratio (inference / analytic) and
+        implied_coverage: the probability that the nominal ci_level interval
+        built from the inference SE covers the truth if the estimate is
+        normal with the analytical SE, 2 Phi(z * SE_ratio) - 1. This only
+        restates SE_ratio; coverage() measures coverage. Includes the overall
+        row when both tables report one.
+    """
+    rows = {"SE_analytic": analytic["SE"], "SE_inference": inference["SE"].reindex(analytic.index)}
+    table = pd.DataFrame(rows)
+    if "overall" in analytic.attrs and "overall" in inference.attrs:
+        table.loc["overall"] = [analytic.attrs["overall"]["SE"], inference.attrs["overall"]["SE"]]
+    table["SE_ratio"] = table["SE_inference"] / table["SE_analytic"]
+    z = sps.norm.ppf(0.5 + ci_level / 200)
+    table["implied_coverage"] = 2 * sps.norm.cdf(z * table["SE_ratio"]) - 1
+    return table
+
+
+def _event_time(label):
+    """Event time of a result row: an integer label, Effect_l (l - 1) or Placebo_k (-k); else None."""
+    if isinstance(label, (int, np.integer)):
+        return int(label)
+    name, _, lag = str(label).rpartition("_")
+    if lag.isdigit() and name in ("Effect", "Placebo"):
+        return int(lag) - 1 if name == "Effect" else -int(lag)
+    return None
+
+
+def _true_effects(panel, index):
+    """
+    Sample ATT of a sim_panel table (truth=True) for each row of index.
+
+    Event time k >= 0 averages tau_gt over the treated rows k periods after
+    adoption; leads (k < 0) are 0; rows without an event time are NaN. The
+    last entry is the ATT over every treated row, the overall estimand of
+    imputation.did_imputation.
+    """
+    g = panel.column("first_treat").to_numpy()
+    rel = panel.column("year").to_numpy() - g
+    tau = panel.column("tau_gt").to_numpy()
+    treated = (g > 0) & (rel >= 0)
+    means = pd.Series(tau[treated]).groupby(rel[treated]).mean()
+    truth = [np.nan if k is None else 0.0 if k < 0 else means.get(k, np.nan)
+             for k in map(_event_time, index)]
+    return np.append(truth, tau[treated].mean())
+
+
+def coverage(estimator, n_reps=50, n_units=2000, method="blb", seed=SEED, ci_level=95,
+             overall=True, **kwargs):
+    """
+    Empirical coverage of the subsample and the analytical CIs on simulated panels.
+
+    Replicate r is sim_panel.generate(n_units, truth=True) with a seed drawn
+    from SeedSequence(seed, spawn_key=(r,)), so its true effects are known
+    (see _true_effects). Each replicate is fitted once with estimator; the
+    subsample SEs come from subsample_se(..., full=<that fit>).
+
+    Parameters
+    ----------
+    estimator : callable
+        As in subsample_se(); must take the sim_panel columns (id, year, y,
+        first_treat) and report an Estimate and an SE per event time.
+    n_reps : int
+        Replicate panels.
+    overall : bool
+        Also score the overall row. Its truth is the ATT over every treated
+        row, so leave it off for estimators whose overall averages the event
+        times instead (csdid's dynamic aggregation).
+    **kwargs
+        Passed to subsample_se() (gamma, n_subsets, n_resamples, max_workers).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per event time (and overall) with Truth, Coverage_analytic,
+        Coverage_<method>, SE_analytic and SE_<method> (means over
+        replicates) and SD_estimate (the Monte Carlo SD of the estimation
+        error, which both SEs should match). attrs holds n_reps, n_units,
+        method, ci_level and time (seconds).
+    """
+    import polars as pl
+
+    z = sps.norm.ppf(0.5 + ci_level / 200)
+    start = time.perf_counter()
+    index = None
+    rows = {"Truth": [], "Estimate": [], "SE_analytic": [], f"SE_{method}": []}
+    for r in range(n_reps):
+        seq = np.random.SeedSequence(seed, spawn_key=(r,))
+        arrow = sim_panel.generate(n_units, seed=int(seq.generate_state(1, np.uint64)[0]), truth=True)
+        panel = pl.from_arrow(arrow.drop(["tau_gt"]))
+        full = estimator(panel)
+        # Event times are fixed by the first replicate
+        index = full.index if index is None else index
+        table = subsample_se(panel, "id", estimator, method=method,
+                             seed=int(seq.spawn(1)[0].generate_state(1, np.uint64)[0]),
+                             ci_level=ci_level, full=full, **kwargs)
+        theta = _params(full, index)
+        n = len(theta) if overall else len(index)
+        rows["Truth"].append(_true_effects(arrow, index)[:n])
+        rows["Estimate"].append(theta[:n])
+        rows["SE_analytic"].append(_params(full, index, "SE")[:n])
+        rows[f"SE_{method}"].append(_params(table, index, "SE")[:n])
+    draws = {k: np.vstack(v) for k, v in rows.items()}
+
+    labels = list(index) + ["overall"] * (draws["Truth"].shape[1] - len(index))
+    result = pd.DataFrame({"Truth": draws["Truth"].mean(axis=0)},
+                          index=pd.Index(labels, dtype=object, name=index.name))
+    error = draws["Estimate"] - draws["Truth"]
+    for k in ("analytic", method):
+        covered = np.mean(np.abs(error) <= z * draws[f"SE_{k}"], axis=0)
+        result[f"Coverage_{k}"] = np.where(np.isnan(result["Truth"]), np.nan, covered)
+    for k in ("analytic", method):
+        result[f"SE_{k}"] = draws[f"SE_{k}"].mean(axis=0)
+    result["SD_estimate"] = error.std(axis=0, ddof=1)
+    result.attrs.update(n_reps=n_reps, n_units=n_units, method=method, ci_level=ci_level,
+                        time=time.perf_counter() - start)
+    return result
+
+
+def csdid_table(data, outcome, group, time, cohort, typec="dynamic", weights=None, est_method="dr"):
+    """
+    csdid aggregation as an Estimate/SE table (analytical SEs, no bootstrap).
+
+    Fits ATTgt with `weights` as its weights_name and aggregates through
+    attgt_store.ATTgtStore, so it can serve as a subsample_se() estimator.
+    """
+    from csdid.att_gt import ATTgt
+
+    from attgt_store import ATTgtStore
+
+    if not hasattr(data, "iloc"):
+        data = data.to_pandas()
+    fit = ATTgt(yname=outcome, gname=cohort, idname=group, tname=time, data=data,
+                weights_name=weights).fit(est_method=est_method)
+    return ATTgtStore.from_csdid(fit, dtype=np.float64).aggte(typec, na_rm=True, bstrap=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--data", default="../sim_data.csv", help="CSV or Parquet panel (id, year, y, first_treat)")
+    parser.add_argument("--estimator", choices=["imputation", "dcdh", "csdid"], default="imputation")
+    parser.add_argument("--method", choices=METHODS, default="blb")
+    parser.add_argument("--gamma", type=float, default=GAMMA)
+    parser.add_argument("--subsets", type=int, default=None, help="default: 10 (blb), 100 (subsample)")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--replicates", type=int, default=None,
+                        help="measure CI coverage on this many simulated panels instead of fitting --data")
+    parser.add_argument("--units", type=int, default=2000, help="units per simulated panel (--replicates)")
+    args = parser.parse_args()
+
+    import polars as pl
+
+    columns = dict(outcome="y", group="id", time="year", cohort="first_treat")
+    if args.estimator == "imputation":
+        from imputation import did_imputation
+        estimator = partial(did_imputation, **columns)
+    elif args.estimator == "dcdh":
+        from dcdh_stream import dcdh_stream
+        if args.method == "blb":
+            parser.error("dcdh_stream takes no weights; use --method subsample")
+        estimator = partial(dcdh_stream, **columns, effects=5, placebo=3)
+    else:
+        estimator = partial(csdid_table, **columns)
+
+    if args.replicates:
+        table = coverage(estimator, n_reps=args.replicates, n_units=args.units, method=args.method,
+                         seed=args.seed, overall=args.estimator == "imputation", gamma=args.gamma,
+                         n_subsets=args.subsets, n_resamples=args.resamples, max_workers=args.workers)
+        print(f"{args.estimator}, {args.method}: {args.replicates} panels of {args.units} units, "
+              f"{table.attrs['time']:.2f} s\n")
+        print(table.to_string(float_format="%.4f"))
+        return
+
+    data = pl.read_parquet(args.data) if args.data.endswith(".parquet") else pl.read_csv(args.data)
+    if args.estimator == "dcdh":
+        data = data.sort(["id", "year"])
+
+    start = time.perf_counter()
+    analytic = estimator(data)
+    fit_time = time.perf_counter() - start
+    table = subsample_se(data, "id", estimator, method=args.method, gamma=args.gamma,
+                         n_subsets=args.subsets, n_resamples=args.resamples, seed=args.seed,
+                         max_workers=args.workers, full=analytic)
+    print(f"{args.estimator}, {args.method}: {table.attrs['n_units']} units, sets of "
+          f"{table.attrs['subset_size']}; full fit {fit_time:.2f} s, sets {table.attrs['time']:.2f} s\n")
+    print(compare_se(analytic, table).to_string(float_format="%.4f"))
+
+
+if __name__ == "__main__":
+    main()
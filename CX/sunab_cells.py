@@ -0,0 +1,201 @@
+"""
+File: sunab_cells.py
+Purpose: Sun-Abraham interaction-weighted event study from cohort x period sufficient statistics
+
+The saturated Sun-Abraham regression (unit and period fixed effects plus
+cohort x relative-time dummies, never-treated groups as controls) only
+involves regressors that are constant within cohort x period cells. Groups
+are partitioned by cohort and by which periods have an observed outcome;
+the two-way within transform of the regressors and the period effects of the
+outcome are then solved by alternating projections over these cells, the
+normal equations need the per-partition number of groups and outcome sums,
+and the group-clustered scores need the per-partition Gram matrix of the
+outcome paths. dcdh_stream.prepare_panel(by_pattern=True) accumulates all of
+it in one streamed pass, so the estimates cost O(cells x periods) per sweep
+whatever the number of rows, and match the row-level regression (rows with a
+missing outcome dropped) to numerical precision.
+
+Cohort effects are averaged into event-time effects with the cohort-share
+weights of Sun & Abraham (2021), each cohort's share of the observations at
+that event time; their SEs treat the shares as fixed.
+
+Usage:
+    from sunab_cells import sunab_cells
+    table = sunab_cells(df_pl, outcome="y", group="id", time="year", cohort="first_treat")
+    table.attrs["cohort_effects"]
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sps
+
+from dcdh_stream import CHUNK_GROUPS, PreparedPanel, prepare_panel
+
+TOL = 1e-12
+MAX_ITER = 10_000
+
+
+def _partitions(periods, stats):
+    """(cohort, observed mask, n, sums, Gram) per partition; cohort keys mean fully observed."""
+    parts = []
+    for key, (n, S, G) in stats.items():
+        cohort, mask = key if isinstance(key, tuple) else (key, (1,) * len(periods))
+        mask = np.asarray(mask, dtype=float)
+        if n and mask.any():
+            parts.append((cohort, mask, float(n), S, G))
+    return parts
+
+
+def _design(periods, parts, never_treated, ref, event_min, event_max):
+    """Per-partition (periods x K) dummy matrices and the (cohort, event time) of each column."""
+    relative = {}
+    observed = {}
+    for cohort, mask, *_ in parts:
+        if cohort != never_treated:
+            relative[cohort] = np.clip(periods - cohort, event_min, event_max)
+            observed[cohort] = observed.get(cohort, 0) + mask
+    # A cohort whose reference period is never observed is not identified
+    cohorts = sorted(g for g in relative if observed[g][relative[g] == ref].any())
+    columns = [(g, int(e)) for g in cohorts
+               for e in np.unique(relative[g][observed[g] > 0]) if e != ref]
+    position = {c: j for j, c in enumerate(columns)}
+
+    designs, kept = [], []
+    for part in parts:
+        cohort, mask = part[0], part[1]
+        if cohort != never_treated and cohort not in cohorts:
+            continue
+        D = np.zeros((len(periods), len(columns)))
+        if cohort != never_treated:
+            for t, e in enumerate(relative[cohort]):
+                if mask[t] and e != ref:
+                    D[t, position[(cohort, int(e))]] = 1.0
+        designs.append(D)
+        kept.append(part)
+    return designs, kept, columns
+
+
+def _within(values, masks, weights, tol=TOL, max_iter=MAX_ITER):
+    """
+    Two-way (group, period) within transform of cell-level values, by alternating projections.
+
+    values[p] is a (periods x k) array for partition p, constant over its
+    groups and zero where unobserved; weights[p] is its number of groups.
+    """
+    out = [v * m[:, None] for v, m in zip(values, masks)]
+    period_n = sum(w * m for w, m in zip(weights, masks))
+    period_n[period_n == 0] = 1.0
+    for _ in range(max_iter):
+        change = 0.0
+        for i, m in enumerate(masks):
+            means = out[i].sum(axis=0) / m.sum()
+            out[i] -= m[:, None] * means
+            change = max(change, np.abs(means).max(initial=0.0))
+        period_means = sum(w * v for w, v in zip(weights, out)) / period_n[:, None]
+        for i, m in enumerate(masks):
+            out[i] -= m[:, None] * period_means
+        change = max(change, np.abs(period_means).max(initial=0.0))
+        if change < tol:
+            break
+    return out
+
+
+def _period_effects(parts, n_periods, tol=TOL, max_iter=MAX_ITER):
+    """Period fixed effects of the outcome in its two-way FE regression, from partition sums."""
+    period_n = sum(n * mask for _, mask, n, _, _ in parts)
+    period_n[period_n == 0] = 1.0
+    lam = np.zeros(n_periods)
+    for _ in range(max_iter):
+        # Sum over the groups of each partition of (y_it - alpha_i), given lam
+        resid = sum(mask * (S - (mask @ S - n * (mask @ lam)) / mask.sum())
+                    for _, mask, n, S, _ in parts)
+        new = resid / period_n
+        if np.abs(new - lam).max() < tol:
+            return new
+        lam = new
+    return lam
+
+
+def sunab_cells(data, outcome=None, group=None, time=None, cohort=None, never_treated=0,
+                ref=-1, event_min=None, event_max=None, chunk_groups=CHUNK_GROUPS, ci_level=95):
+    """
+    Sun-Abraham event-time effects with group-clustered standard errors.
+
+    Parameters
+    ----------
+    data : PreparedPanel, pyarrow.Table, polars or pandas DataFrame
+        A dcdh_stream.prepare_panel() result, or a panel sorted by group and
+        time with every group listed in every period (the outcome may be
+        missing).
+    outcome, group, time, cohort : str
+        Column names (not needed for a PreparedPanel); `cohort` is the first
+        treated period.
+    never_treated : scalar
+        Cohort value of the never-treated (control) groups.
+    ref : int
+        Omitted relative period (time - cohort); -1 is the period before treatment.
+    event_min, event_max : int, optional
+        Relative periods outside [event_min, event_max] are binned into the endpoints.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per event time with Estimate, SE, t, p, LB CI and UB CI.
+        attrs holds n (rows used), n_groups, n_cells and cohort_effects, the
+        (cohort, event time) coefficients with their SEs. Cohorts whose
+        reference period is never observed are dropped.
+    """
+    if not isinstance(data, PreparedPanel):
+        data = prepare_panel(data, outcome, group, time, cohort, chunk_groups, by_pattern=True)
+    periods = data.periods.astype(np.int64)
+    parts = _partitions(periods, data.stats)
+    if not any(p[0] == never_treated for p in parts):
+        raise ValueError("sunab_cells needs never-treated groups as the control cohort")
+
+    event_min = -np.inf if event_min is None else event_min
+    event_max = np.inf if event_max is None else event_max
+    designs, parts, columns = _design(periods, parts, never_treated, ref, event_min, event_max)
+    masks = [p[1] for p in parts]
+    n_p = [p[2] for p in parts]
+    tilde = _within(designs, masks, n_p)
+
+    A = sum(n * X.T @ X for n, X in zip(n_p, tilde))
+    b = sum(X.T @ S for X, (_, _, _, S, _) in zip(tilde, parts))
+    A_inv = np.linalg.inv(A)
+    beta = A_inv @ b
+
+    # Group scores are X_p' y_i - c_p; the meat needs only n, sums and Gram per partition
+    lam = _period_effects(parts, len(periods))
+    meat = np.zeros_like(A)
+    for X, (_, mask, n, S, G) in zip(tilde, parts):
+        c = X.T @ (mask * lam + X @ beta)
+        XS = X.T @ S
+        meat += X.T @ G @ X - np.outer(XS, c) - np.outer(c, XS) + n * np.outer(c, c)
+
+    N = sum(n_p)
+    n_rows = int(sum(n * m.sum() for n, m in zip(n_p, masks)))
+    n_params = len(columns) + len(periods) - 1  # unit effects are nested in the clusters
+    adj = N / (N - 1) * (n_rows - 1) / (n_rows - n_params)
+    vcov = adj * A_inv @ meat @ A_inv
+
+    # Interaction weights: each cohort's share of the observations at an event time
+    cell_n = sum(n * D.sum(axis=0) for n, D in zip(n_p, designs))
+    events = sorted({e for _, e in columns})
+    W = np.zeros((len(events), len(columns)))
+    for j, (_, e) in enumerate(columns):
+        W[events.index(e), j] = cell_n[j]
+    W /= W.sum(axis=1, keepdims=True)
+
+    z = sps.t.ppf(0.5 + ci_level / 200, N - 1)
+
+    def table(est, var, index):
+        se = np.sqrt(np.diag(var))
+        t = est / se
+        return pd.DataFrame({"Estimate": est, "SE": se, "t": t, "p": 2 * sps.t.sf(np.abs(t), N - 1),
+                             "LB CI": est - z * se, "UB CI": est + z * se}, index=index)
+
+    result = table(W @ beta, W @ vcov @ W.T, pd.Index(events, name="event_time"))
+    cohort_effects = table(beta, vcov, pd.MultiIndex.from_tuples(columns, names=["cohort", "event_time"]))
+    result.attrs.update(n=n_rows, n_groups=int(N), n_cells=len(parts) * len(periods),
+                        cohort_effects=cohort_effects)
+    return result
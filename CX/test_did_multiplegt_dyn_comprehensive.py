@@ -1,15 +1,26 @@
 ################################################################################
 # File: test_did_multiplegt_dyn_comprehensive.py
 # Purpose: Comprehensive test of did_multiplegt_dyn matching all Stata specs
-# OUTPUT: runtime_Python.csv, coefficients_Python.csv
+# OUTPUT: runtime_Python.csv, coefficients_Python.csv, phases_Python.csv
+# Usage: python test_did_multiplegt_dyn_comprehensive.py [--force] [--profile [DIR]]
+#        (--force re-fits specs whose results are in .result_cache/;
+#         --profile writes profiles/polars-<version>/<example>_<model>.folded)
 ################################################################################
 
+import argparse
 import sys
-import time
 import pandas as pd
 import numpy as np
 import polars as pl
 import warnings
+from contextlib import nullcontext
+
+from coef_extract import concat, from_dyn_result
+from data_cache import load_dta
+from instrument import Recorder
+from result_cache import ResultCache, dataset_fingerprint, estimator_id, spec_key
+from results_store import package_version
+from sampling_profile import SamplingProfiler, profile_path
 
 # Add path to did_multiplegt_dyn module
 sys.path.insert(0, "/Users/anzony.quisperojas/Documents/GitHub/did_multiplegt_dyn_py/polars")
@@ -22,38 +33,66 @@ SAVE_PATH = "/Users/anzony.quisperojas/Documents/GitHub/diff_diff_test/CX"
 
 # Initialize results storage
 runtime_results = []
-coef_results = []
+coef_tables = []
+recorder = Recorder(platform="Python", backend="polars")
+result_cache = ResultCache()
+dataset_keys = {}  # example -> dataset_fingerprint of the loaded file
+profile_dir = None  # set by --profile: sampling profile of every fit
+
+
+def load_example(example, path, columns):
+    """Load a dataset and remember its fingerprint for the result cache."""
+    dataset_keys[example] = dataset_fingerprint(path, columns)
+    return load_dta(path, columns=columns)
 
 
 def run_test(df, outcome, group, time_col, treatment, example, model, **kwargs):
-    """Run a single test and capture results."""
+    """Run a single test and capture results (reused from the result cache when unchanged)."""
     print(f"--- {example} : {model} ---")
-    start = time.time()
+    key = spec_key(dataset_keys.get(example, example), estimator_id(did_multiplegt_main),
+                   dict(outcome=outcome, group=group, time=time_col, treatment=treatment, **kwargs))
+    entry = result_cache.get(key)
+    if entry is not None:
+        print(f"Runtime: {entry['metrics']['Runtime_sec']:.4f} seconds [cached]\n")
+        runtime_results.append({"Example": example, "Model": model, **entry["metrics"],
+                                "Platform": "Python", "Cached": True})
+        coef_tables.append(from_dyn_result(entry["result"], example=example, model=model))
+        return entry["result"]
+
+    n_phases = len(recorder.rows)
 
     # Convert to polars if needed
-    if isinstance(df, pd.DataFrame):
-        df_pl = pl.from_pandas(df)
-    else:
-        df_pl = df
-
-    try:
-        result = did_multiplegt_main(
-            df=df_pl,
-            outcome=outcome,
-            group=group,
-            time=time_col,
-            treatment=treatment,
-            **kwargs
-        )
-        success = True
-    except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
-        result = None
-        success = False
-
-    elapsed = time.time() - start
+    with recorder.phase("convert", example=example, model=model):
+        if isinstance(df, pd.DataFrame):
+            df_pl = pl.from_pandas(df)
+        else:
+            df_pl = df
+
+    profiler = SamplingProfiler() if profile_dir is not None else nullcontext()
+    with recorder.phase("fit", example=example, model=model), profiler:
+        try:
+            result = did_multiplegt_main(
+                df=df_pl,
+                outcome=outcome,
+                group=group,
+                time=time_col,
+                treatment=treatment,
+                **kwargs
+            )
+            success = True
+        except Exception as e:
+            print(f"Error: {e}")
+            import traceback
+            traceback.print_exc()
+            result = None
+            success = False
+
+    if profile_dir is not None:
+        backend = f"polars-{package_version('py-did-multiplegt-dyn', 'did_multiplegt_dyn') or 'local'}"
+        print(f"Profile: {profiler.write(profile_path(profile_dir, backend, example, model))}")
+
+    # Runtime = conversion + fit, as before
+    elapsed = sum(r["wall_sec"] for r in recorder.rows[n_phases:])
     print(f"Runtime: {elapsed:.4f} seconds\n")
 
     # Store runtime
@@ -61,73 +100,37 @@ def run_test(df, outcome, group, time_col, treatment, example, model, **kwargs):
         "Example": example,
         "Model": model,
         "Runtime_sec": elapsed,
-        "Platform": "Python"
+        "Platform": "Python",
+        "Cached": False
     })
+    if success and result is not None:
+        result_cache.put(key, {"result": result, "metrics": {"Runtime_sec": elapsed}})
 
-    # Helper function to extract numeric index from string like "Effect_1" or "Placebo_2"
-    def extract_numeric_index(idx):
-        if isinstance(idx, (int, float)):
-            return int(idx)
-        if isinstance(idx, str):
-            # Try to extract number from strings like "Effect_1", "Placebo_2"
-            import re
-            match = re.search(r'(\d+)$', idx)
-            if match:
-                return int(match.group(1))
-        return idx
-
-    # Extract Effects if successful
+    # Extract Effects, Average and Placebos as one columnar table
     if success and result is not None:
-        try:
-            dyn_results = result.get("did_multiplegt_dyn", {})
-
-            # Extract Effects
-            effects_df = dyn_results.get("Effects")
-            if effects_df is not None and len(effects_df) > 0:
-                for idx, row in effects_df.iterrows():
-                    if idx != "Average":  # Skip average row for now
-                        coef_results.append({
-                            "Example": example,
-                            "Model": model,
-                            "Type": "Effect",
-                            "Index": extract_numeric_index(idx),
-                            "Estimate": row.get("Estimate", row.get("estimate", np.nan)),
-                            "SE": row.get("SE", row.get("se", np.nan))
-                        })
-
-                # Extract Average Effect
-                if "Average" in effects_df.index:
-                    avg_row = effects_df.loc["Average"]
-                    coef_results.append({
-                        "Example": example,
-                        "Model": model,
-                        "Type": "Avg_Effect",
-                        "Index": 0,
-                        "Estimate": avg_row.get("Estimate", avg_row.get("estimate", np.nan)),
-                        "SE": avg_row.get("SE", avg_row.get("se", np.nan))
-                    })
-
-            # Extract Placebos
-            placebos_df = dyn_results.get("Placebos")
-            if placebos_df is not None and len(placebos_df) > 0:
-                for idx, row in placebos_df.iterrows():
-                    coef_results.append({
-                        "Example": example,
-                        "Model": model,
-                        "Type": "Placebo",
-                        "Index": extract_numeric_index(idx),
-                        "Estimate": row.get("Estimate", row.get("estimate", np.nan)),
-                        "SE": row.get("SE", row.get("se", np.nan))
-                    })
-
-            print("Effects extracted successfully")
-        except Exception as e:
-            print(f"Warning: Could not extract effects: {e}")
+        with recorder.phase("extract", example=example, model=model):
+            try:
+                coef_tables.append(from_dyn_result(result, example=example, model=model))
+                print("Effects extracted successfully")
+            except Exception as e:
+                print(f"Warning: Could not extract effects: {e}")
 
     return result
 
 
 def main():
+    global profile_dir
+    parser = argparse.ArgumentParser(description="Comprehensive did_multiplegt_dyn Python tests")
+    parser.add_argument("--force", action="store_true",
+                        help="re-fit every spec instead of reusing cached results")
+    parser.add_argument("--profile", nargs="?", const=f"{SAVE_PATH}/profiles", default=None, metavar="DIR",
+                        help="write a sampling profile of each fit under DIR/polars-<version>/ "
+                             "(default DIR: profiles/ next to the CSVs); implies --force")
+    args = parser.parse_args()
+    # A fit reused from the cache has no profile
+    result_cache.force = args.force or args.profile is not None
+    profile_dir = args.profile
+
     print("=" * 80)
     print("did_multiplegt_dyn Comprehensive Python Tests")
     print(f"Python version: {sys.version}")
@@ -140,7 +143,8 @@ def main():
     print("WAGEPAN DATASET")
     print("=" * 80 + "\n")
 
-    wagepan = pd.read_stata(f"{DATA_PATH}/wagepan.dta")
+    wagepan = load_example("Wagepan", f"{DATA_PATH}/wagepan.dta",
+                           columns=["nr", "year", "lwage", "union", "hours", "black", "educ", "hisp"])
     print(f"Data loaded: {len(wagepan)} observations\n")
 
     # Define common parameters for wagepan
@@ -241,7 +245,8 @@ def main():
     print("=" * 80 + "\n")
 
     try:
-        favara = pd.read_stata(f"{DATA_PATH}/favara_imbs.dta")
+        favara = load_example("Favara_Imbs", f"{DATA_PATH}/favara_imbs.dta",
+                              columns=["county", "year", "Dl_hpi", "inter_bra", "state_n"])
         print(f"Data loaded: {len(favara)} observations\n")
         run_test(favara, "Dl_hpi", "county", "year", "inter_bra", "Favara_Imbs", "Baseline",
                  effects=5, placebo=3, cluster="state_n")
@@ -256,7 +261,8 @@ def main():
     print("=" * 80 + "\n")
 
     try:
-        deryugina = pd.read_stata(f"{DATA_PATH}/deryugina_2017.dta")
+        deryugina = load_example("Deryugina", f"{DATA_PATH}/deryugina_2017.dta",
+                                 columns=["county_fips", "year", "log_curr_trans_ind_gov_pc", "hurricane"])
         print(f"Data loaded: {len(deryugina)} observations\n")
         run_test(deryugina, "log_curr_trans_ind_gov_pc", "county_fips", "year", "hurricane",
                  "Deryugina", "Baseline", effects=11, placebo=11, cluster="county_fips")
@@ -271,7 +277,8 @@ def main():
     print("=" * 80 + "\n")
 
     try:
-        gentzkow = pd.read_stata(f"{DATA_PATH}/gentzkow.dta")
+        gentzkow = load_example("Gentzkow", f"{DATA_PATH}/gentzkow.dta",
+                                columns=["cnty90", "year", "prestout", "numdailies"])
         print(f"Data loaded: {len(gentzkow)} observations\n")
         run_test(gentzkow, "prestout", "cnty90", "year", "numdailies", "Gentzkow", "Non_Normalized",
                  effects=4, placebo=4)
@@ -294,13 +301,17 @@ def main():
     runtime_df.to_csv(f"{SAVE_PATH}/runtime_Python.csv", index=False)
 
     print("\nCOEFFICIENTS SUMMARY")
-    coef_df = pd.DataFrame(coef_results)
+    coef_df = concat(coef_tables)
     print(coef_df.head(40))
-    coef_df.to_csv(f"{SAVE_PATH}/coefficients_Python.csv", index=False)
+    coef_df.write_csv(f"{SAVE_PATH}/coefficients_Python.csv")
+
+    # Per-phase metrics (convert / fit / extract), long format, appended across runs
+    recorder.append_csv(f"{SAVE_PATH}/phases_Python.csv")
 
     print("\nResults saved to:")
     print(f"  - {SAVE_PATH}/runtime_Python.csv")
     print(f"  - {SAVE_PATH}/coefficients_Python.csv")
+    print(f"  - {SAVE_PATH}/phases_Python.csv")
 
     print("\n" + "=" * 80)
     print("COMPLETE")
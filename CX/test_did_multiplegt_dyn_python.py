@@ -9,17 +9,39 @@ Requirements:
     pip install py-did-multiplegt-dyn pandas numpy scipy statsmodels
     # Or install from local:
     # pip install -e /Users/anzony.quisperojas/Documents/GitHub/did_multiplegt_dyn_py
+
+Usage:
+    python test_did_multiplegt_dyn_python.py              # specs run one after another
+    python test_did_multiplegt_dyn_python.py --parallel   # one worker process per spec
+    python test_did_multiplegt_dyn_python.py --trials 10 --warmup 2   # median/IQR/CI per spec
+    python test_did_multiplegt_dyn_python.py --force      # re-time specs already in .result_cache/
+    python test_did_multiplegt_dyn_python.py --profile    # + profiles/pandas-<version>/<example>_<model>.folded
 """
 
 import sys
 import os
 import time
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from data_cache import load_dta, spec_columns
+from spec_pool import run_specs_parallel
+from trials import timed_trials
+from result_cache import ResultCache, dataset_fingerprint
+from results_store import ResultsDB, package_version
+from sampling_profile import profile_path
+
 # Add the local package path
-sys.path.insert(0, '/Users/anzony.quisperojas/Documents/GitHub/did_multiplegt_dyn_py')
+LOCAL_PACKAGE_PATH = '/Users/anzony.quisperojas/Documents/GitHub/did_multiplegt_dyn_py'
+sys.path.insert(0, LOCAL_PACKAGE_PATH)
+
+# Estimator import candidates, tried in order (also used by the worker processes)
+ESTIMATOR_CANDIDATES = [
+    ("did_multiplegt_main", "did_multiplegt_main"),
+    ("py_did_multiplegt_dyn", "did_multiplegt_dyn"),
+]
 
 # Import the main function
 try:
@@ -42,43 +64,61 @@ SAVE_PATH = Path("/Users/anzony.quisperojas/Documents/GitHub/diff_diff_test/CX")
 # Runtime results storage
 runtime_results = []
 
+# Fitted outputs and timings of unchanged specs are reused (see result_cache.py)
+result_cache = ResultCache()
 
-def read_dta_file(filepath):
-    """Read Stata .dta file into pandas DataFrame"""
-    return pd.read_stata(filepath)
+# Wagepan test configurations matching Stata/R
+test_configs = [
+    {"name": "Baseline", "effects": 5, "placebo": 0, "extra": {}},
+    {"name": "Placebos", "effects": 5, "placebo": 2, "extra": {}},
+    {"name": "Normalized", "effects": 5, "placebo": 2, "extra": {"normalized": True}},
+    {"name": "Controls", "effects": 5, "placebo": 2, "extra": {"controls": "hours"}},
+    {"name": "Trends_Nonparam", "effects": 5, "placebo": 2, "extra": {"trends_nonparam": "black"}},
+    {"name": "Trends_Lin", "effects": 5, "placebo": 2, "extra": {"trends_lin": True}},
+    {"name": "Cluster", "effects": 5, "placebo": 2, "extra": {"cluster": "hisp"}},
+    {"name": "Same_Switchers", "effects": 5, "placebo": 2, "extra": {"same_switchers": True}},
+    {"name": "Switchers_In", "effects": 5, "placebo": 2, "extra": {"switchers": "in"}},
+    {"name": "Switchers_Out", "effects": 5, "placebo": 2, "extra": {"switchers": "out"}},
+]
 
 
-def run_timed_estimation(df, outcome, group, time_var, treatment, example, model, **kwargs):
-    """Run estimation with timing and store results"""
-    print(f"--- {model} ---")
+def read_dta_file(filepath, columns=None):
+    """Read Stata .dta file into pandas DataFrame (through the columnar cache)"""
+    return load_dta(filepath, columns=columns)
 
-    start_time = time.time()
 
-    try:
-        result = did_multiplegt_main(
-            df=df,
-            outcome=outcome,
-            group=group,
-            time=time_var,
-            treatment=treatment,
-            **kwargs
-        )
-        error = None
-    except Exception as e:
-        result = None
-        error = str(e)
+def run_timed_estimation(df, outcome, group, time_var, treatment, example, model,
+                         n_trials=1, warmup=0, dataset=None, profile=None, **kwargs):
+    """Run estimation with timing and store results (cached when `dataset` is given)"""
+    print(f"--- {model} ---")
 
-    exec_time = time.time() - start_time
-    print(f"Runtime: {exec_time:.4f} seconds")
+    fit_kwargs = dict(df=df, outcome=outcome, group=group, time=time_var, treatment=treatment, **kwargs)
+    if dataset is None:
+        result, metrics, error = timed_trials(did_multiplegt_main, n_trials=n_trials, warmup=warmup,
+                                              profile=profile, **fit_kwargs)
+    else:
+        result, metrics, error = result_cache.timed_trials(did_multiplegt_main, dataset=dataset,
+                                                           n_trials=n_trials, warmup=warmup,
+                                                           profile=profile, **fit_kwargs)
+
+    exec_time = metrics['Runtime_sec']
+    print(f"Runtime: {exec_time:.4f} seconds (CPU {metrics['CPU_sec']:.4f}s, "
+          f"peak RSS {metrics['Peak_RSS_MB']:.1f} MB)" + (" [cached]" if metrics.get('Cached') else ""))
+    if metrics['N_trials'] > 1:
+        print(f"  median of {metrics['N_trials']} trials, IQR {metrics['Runtime_IQR']:.4f}s, "
+              f"95% CI [{metrics['Runtime_CI_low']:.4f}, {metrics['Runtime_CI_high']:.4f}], "
+              f"cold start {metrics['Cold_sec']:.4f}s")
 
     if error:
         print(f"Error: {error}")
+    if profile is not None and not metrics.get('Cached'):
+        print(f"Profile: {profile}")
 
     # Store runtime
     runtime_results.append({
         'Example': example,
         'Model': model,
-        'Runtime_sec': exec_time,
+        **metrics,
         'Platform': 'Python',
         'Error': error
     })
@@ -86,268 +126,224 @@ def run_timed_estimation(df, outcome, group, time_var, treatment, example, model
     return result, exec_time, error
 
 
-print("=" * 80)
-print("did_multiplegt_dyn Python Package Tests with Runtime Tracking")
-print("=" * 80)
-print()
-
-################################################################################
-#                    WAGEPAN DATASET TESTS (MAIN BENCHMARK)
-################################################################################
-
-print("\n" + "=" * 80)
-print("WAGEPAN DATASET TESTS - MAIN BENCHMARK")
-print("=" * 80 + "\n")
-
-wagepan_file = DATA_PATH / "wagepan.dta"
-if wagepan_file.exists():
-    wagepan = read_dta_file(wagepan_file)
-    print(f"Data loaded: {len(wagepan):,} observations\n")
-
-    # Test configurations matching Stata/R
-    test_configs = [
-        {"name": "Baseline", "effects": 5, "placebo": 0, "extra": {}},
-        {"name": "Placebos", "effects": 5, "placebo": 2, "extra": {}},
-        {"name": "Normalized", "effects": 5, "placebo": 2, "extra": {"normalized": True}},
-        {"name": "Controls", "effects": 5, "placebo": 2, "extra": {"controls": "hours"}},
-        {"name": "Trends_Nonparam", "effects": 5, "placebo": 2, "extra": {"trends_nonparam": "black"}},
-        {"name": "Trends_Lin", "effects": 5, "placebo": 2, "extra": {"trends_lin": True}},
-        {"name": "Cluster", "effects": 5, "placebo": 2, "extra": {"cluster": "hisp"}},
-        {"name": "Same_Switchers", "effects": 5, "placebo": 2, "extra": {"same_switchers": True}},
-        {"name": "Switchers_In", "effects": 5, "placebo": 2, "extra": {"switchers": "in"}},
-        {"name": "Switchers_Out", "effects": 5, "placebo": 2, "extra": {"switchers": "out"}},
-    ]
-
-    for config in test_configs:
+def build_specs():
+    """Collect every (dataset, config) pair whose dataset is available."""
+    specs = []
+
+    wagepan_file = DATA_PATH / "wagepan.dta"
+    if wagepan_file.exists():
+        for config in test_configs:
+            specs.append({
+                "example": "Wagepan", "model": config["name"], "path": str(wagepan_file),
+                "outcome": "lwage", "group": "nr", "time": "year", "treatment": "union",
+                "kwargs": {"effects": config["effects"], "placebo": config["placebo"], **config["extra"]},
+            })
+    else:
+        print("Wagepan dataset not found. Skipping.")
+
+    favara_file = DATA_PATH / "favara_imbs.dta"
+    if favara_file.exists():
+        specs.append({
+            "example": "Favara_Imbs", "model": "Baseline", "path": str(favara_file),
+            "outcome": "log_hp_all_tiers", "group": "state_fips", "time": "year", "treatment": "dereg",
+            "kwargs": {"effects": 5, "placebo": 3, "cluster": "state_fips"},
+        })
+    else:
+        print("Favara dataset not found. Skipping.")
+
+    deryugina_file = DATA_PATH / "deryugina_2017.dta"
+    if deryugina_file.exists():
+        specs.append({
+            "example": "Deryugina", "model": "Baseline", "path": str(deryugina_file),
+            "outcome": "log_curr_trans_ind_gov_pc", "group": "county_fips", "time": "year",
+            "treatment": "hurricane",
+            "kwargs": {"effects": 11, "placebo": 11, "cluster": "county_fips"},
+        })
+    else:
+        print("Deryugina dataset not found. Skipping.")
+
+    gentzkow_file = DATA_PATH / "gentzkow.dta"
+    if not gentzkow_file.exists():
+        gentzkow_file = DATA_PATH / "gentzkowetal_didtextbook.dta"
+    if gentzkow_file.exists():
+        gentzkow_spec = {
+            "example": "Gentzkow", "path": str(gentzkow_file),
+            "outcome": "prestout", "group": "cnty90", "time": "year", "treatment": "numdailies",
+        }
+        specs.append({**gentzkow_spec, "model": "Non_Normalized",
+                      "kwargs": {"effects": 4, "placebo": 4, "effects_equal": "all"}})
+        specs.append({**gentzkow_spec, "model": "Normalized",
+                      "kwargs": {"effects": 4, "placebo": 4, "normalized": True, "effects_equal": "all"}})
+    else:
+        print("Gentzkow dataset not found. Skipping.")
+
+    # Each dataset is loaded once with the union of the columns its specs need
+    columns_by_path = {}
+    for spec in specs:
+        needed = columns_by_path.setdefault(spec["path"], [])
+        for col in spec_columns(**spec, **spec["kwargs"]):
+            if col not in needed:
+                needed.append(col)
+    for spec in specs:
+        spec["columns"] = columns_by_path[spec["path"]]
+
+    return specs
+
+
+def run_serial(specs, n_trials=1, warmup=0):
+    """Run specs one after another, loading each dataset once."""
+    datasets = {}
+    current_example = None
+    for spec in specs:
+        if spec["example"] != current_example:
+            current_example = spec["example"]
+            print("\n" + "=" * 80)
+            print(f"{current_example.upper()} DATASET")
+            print("=" * 80 + "\n")
+        if spec["path"] not in datasets:
+            datasets[spec["path"]] = read_dta_file(spec["path"], spec["columns"])
+            print(f"Data loaded: {len(datasets[spec['path']]):,} observations\n")
+
         run_timed_estimation(
-            df=wagepan,
-            outcome="lwage",
-            group="nr",
-            time_var="year",
-            treatment="union",
-            example="Wagepan",
-            model=config["name"],
-            effects=config["effects"],
-            placebo=config["placebo"],
-            **config["extra"]
+            df=datasets[spec["path"]],
+            outcome=spec["outcome"],
+            group=spec["group"],
+            time_var=spec["time"],
+            treatment=spec["treatment"],
+            example=spec["example"],
+            model=spec["model"],
+            n_trials=n_trials,
+            warmup=warmup,
+            dataset=dataset_fingerprint(spec["path"], spec["columns"]),
+            profile=spec.get("profile"),
+            **spec["kwargs"]
         )
         print()
 
-else:
-    print("Wagepan dataset not found. Skipping.")
-
-################################################################################
-#                    FAVARA-IMBS DATASET
-################################################################################
-
-print("\n" + "=" * 80)
-print("FAVARA-IMBS DATASET")
-print("=" * 80 + "\n")
-
-favara_file = DATA_PATH / "favara_imbs.dta"
-if favara_file.exists():
-    favara = read_dta_file(favara_file)
-    print(f"Data loaded: {len(favara):,} observations\n")
-
-    run_timed_estimation(
-        df=favara,
-        outcome="log_hp_all_tiers",
-        group="state_fips",
-        time_var="year",
-        treatment="dereg",
-        example="Favara_Imbs",
-        model="Baseline",
-        effects=5,
-        placebo=3,
-        cluster="state_fips"
-    )
-    print()
-else:
-    print("Favara dataset not found. Skipping.")
-
-################################################################################
-#                    DERYUGINA (2017)
-################################################################################
-
-print("\n" + "=" * 80)
-print("DERYUGINA (2017) - Hurricane Effects")
-print("=" * 80 + "\n")
-
-deryugina_file = DATA_PATH / "deryugina_2017.dta"
-if deryugina_file.exists():
-    deryugina = read_dta_file(deryugina_file)
-    print(f"Data loaded: {len(deryugina):,} observations\n")
-
-    run_timed_estimation(
-        df=deryugina,
-        outcome="log_curr_trans_ind_gov_pc",
-        group="county_fips",
-        time_var="year",
-        treatment="hurricane",
-        example="Deryugina",
-        model="Baseline",
-        effects=11,
-        placebo=11,
-        cluster="county_fips"
-    )
-    print()
-else:
-    print("Deryugina dataset not found. Skipping.")
-
-################################################################################
-#                    GENTZKOW (2011)
-################################################################################
-
-print("\n" + "=" * 80)
-print("GENTZKOW (2011) - Newspaper Effects")
-print("=" * 80 + "\n")
-
-gentzkow_file = DATA_PATH / "gentzkow.dta"
-if not gentzkow_file.exists():
-    gentzkow_file = DATA_PATH / "gentzkowetal_didtextbook.dta"
-
-if gentzkow_file.exists():
-    gentzkow = read_dta_file(gentzkow_file)
-    print(f"Data loaded: {len(gentzkow):,} observations\n")
-
-    # Non-normalized
-    run_timed_estimation(
-        df=gentzkow,
-        outcome="prestout",
-        group="cnty90",
-        time_var="year",
-        treatment="numdailies",
-        example="Gentzkow",
-        model="Non_Normalized",
-        effects=4,
-        placebo=4,
-        effects_equal="all"
-    )
-    print()
 
-    # Normalized
-    run_timed_estimation(
-        df=gentzkow,
-        outcome="prestout",
-        group="cnty90",
-        time_var="year",
-        treatment="numdailies",
-        example="Gentzkow",
-        model="Normalized",
-        effects=4,
-        placebo=4,
-        normalized=True,
-        effects_equal="all"
-    )
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallel", action="store_true",
+                        help="send each (dataset, config) pair to a worker process")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per spec, capped at CPU count)")
+    parser.add_argument("--trials", type=int, default=1,
+                        help="timed runs per spec; Runtime_sec is their median (default: 1)")
+    parser.add_argument("--warmup", type=int, default=0,
+                        help="untimed runs before the trials; the first is reported as Cold_sec (default: 0)")
+    parser.add_argument("--force", action="store_true",
+                        help="re-time every spec instead of reusing cached results")
+    parser.add_argument("--cache-size-mb", type=int, default=None,
+                        help="size bound of the result cache (default: 2048)")
+    parser.add_argument("--profile", nargs="?", const=SAVE_PATH / "profiles", default=None, metavar="DIR",
+                        help="write a sampling profile of the first timed run of each spec under "
+                             "DIR/pandas-<version>/ (default DIR: profiles/ next to the CSVs); implies --force")
+    args = parser.parse_args()
+    # A fit reused from the cache has no profile
+    result_cache.force = args.force or args.profile is not None
+    if args.cache_size_mb is not None:
+        result_cache.max_bytes = args.cache_size_mb << 20
+
+    print("=" * 80)
+    print("did_multiplegt_dyn Python Package Tests with Runtime Tracking")
+    print("=" * 80)
     print()
-else:
-    print("Gentzkow dataset not found. Skipping.")
-
-################################################################################
-#                    SAVE AND DISPLAY RESULTS
-################################################################################
-
-print("\n" + "=" * 80)
-print("RUNTIME SUMMARY (PYTHON)")
-print("=" * 80 + "\n")
-
-# Convert to DataFrame
-runtime_df = pd.DataFrame(runtime_results)
-print(runtime_df.to_string(index=False))
-
-# Calculate totals
-total_time = runtime_df['Runtime_sec'].sum()
-print(f"\nTotal runtime: {total_time:.2f} seconds")
-
-# Save runtime results
-runtime_df.to_csv(SAVE_PATH / "runtime_python.csv", index=False)
-print(f"\nResults saved to: {SAVE_PATH / 'runtime_python.csv'}")
-
-################################################################################
-#                    CROSS-PLATFORM COMPARISON
-################################################################################
-
-print("\n" + "=" * 80)
-print("CROSS-PLATFORM COMPARISON")
-print("=" * 80 + "\n")
-
-# Load other platform results if available
-comparison_data = []
-
-# Add Python results
-for _, row in runtime_df.iterrows():
-    comparison_data.append({
-        'Example': row['Example'],
-        'Model': row['Model'],
-        'Platform': 'Python',
-        'Runtime_sec': row['Runtime_sec']
-    })
-
-# Load Stata results
-stata_file = SAVE_PATH / "runtime_stata.csv"
-if stata_file.exists():
-    stata_df = pd.read_csv(stata_file)
-    for _, row in stata_df.iterrows():
-        comparison_data.append({
-            'Example': row['Example'],
-            'Model': row['Model'],
-            'Platform': 'Stata',
-            'Runtime_sec': row['Runtime_sec']
-        })
-
-# Load R CRAN results
-r_cran_file = SAVE_PATH / "runtime_R_cran.csv"
-if r_cran_file.exists():
-    r_cran_df = pd.read_csv(r_cran_file)
-    for _, row in r_cran_df.iterrows():
-        comparison_data.append({
-            'Example': row['Example'],
-            'Model': row['Model'],
-            'Platform': 'R_CRAN',
-            'Runtime_sec': row['Runtime_sec']
-        })
-
-# Load R Polars results
-r_polars_file = SAVE_PATH / "runtime_R_polars.csv"
-if r_polars_file.exists():
-    r_polars_df = pd.read_csv(r_polars_file)
-    for _, row in r_polars_df.iterrows():
-        comparison_data.append({
-            'Example': row['Example'],
-            'Model': row['Model'],
-            'Platform': 'R_Polars',
-            'Runtime_sec': row['Runtime_sec']
-        })
 
-# Create comparison DataFrame
-if len(comparison_data) > len(runtime_df):
-    comparison_df = pd.DataFrame(comparison_data)
-
-    # Pivot for comparison
-    pivot_df = comparison_df.pivot_table(
-        index=['Example', 'Model'],
-        columns='Platform',
-        values='Runtime_sec',
-        aggfunc='first'
-    ).reset_index()
-
-    print("Runtime Comparison (seconds):")
-    print(pivot_df.to_string(index=False))
-
-    # Calculate speedups
-    if 'R_Polars' in pivot_df.columns and 'R_CRAN' in pivot_df.columns:
-        pivot_df['Polars_vs_CRAN_Speedup'] = pivot_df['R_CRAN'] / pivot_df['R_Polars']
-        print(f"\nR Polars vs R CRAN average speedup: {pivot_df['Polars_vs_CRAN_Speedup'].mean():.2f}x")
-
-    # Save comparison
-    comparison_df.to_csv(SAVE_PATH / "runtime_all_platforms.csv", index=False)
-    pivot_df.to_csv(SAVE_PATH / "runtime_comparison_pivot.csv", index=False)
-    print(f"\nComparison saved to: {SAVE_PATH / 'runtime_all_platforms.csv'}")
-    print(f"Pivot table saved to: {SAVE_PATH / 'runtime_comparison_pivot.csv'}")
-else:
-    print("No other platform results found for comparison.")
-    print("Run the Stata and R scripts first.")
-
-print("\n" + "=" * 80)
-print("ESTIMATION COMPLETE - Python Package")
-print("=" * 80)
+    specs = build_specs()
+    backend = f"pandas-{package_version('py-did-multiplegt-dyn', 'did_multiplegt_dyn') or 'local'}"
+    for spec in specs:
+        spec["n_trials"] = args.trials
+        spec["warmup"] = args.warmup
+        if args.profile is not None:
+            spec["profile"] = str(profile_path(args.profile, backend, spec["example"], spec["model"]))
+
+    ############################################################################
+    #                    RUN ALL SPECIFICATIONS
+    ############################################################################
+
+    if args.parallel:
+        print(f"\nRunning {len(specs)} specs in parallel worker processes\n")
+        sweep_start = time.perf_counter()
+        runtime_results.extend(run_specs_parallel(
+            specs,
+            estimator=ESTIMATOR_CANDIDATES,
+            extra_paths=[LOCAL_PACKAGE_PATH],
+            loader=read_dta_file,
+            max_workers=args.workers,
+            cache=result_cache,
+        ))
+        print(f"\nSweep wall time: {time.perf_counter() - sweep_start:.2f} seconds")
+    else:
+        run_serial(specs, n_trials=args.trials, warmup=args.warmup)
+
+    ############################################################################
+    #                    SAVE AND DISPLAY RESULTS
+    ############################################################################
+
+    print("\n" + "=" * 80)
+    print("RUNTIME SUMMARY (PYTHON)")
+    print("=" * 80 + "\n")
+
+    # Convert to DataFrame
+    runtime_df = pd.DataFrame(runtime_results)
+    print(runtime_df.to_string(index=False))
+
+    # Calculate totals
+    total_time = runtime_df['Runtime_sec'].sum()
+    print(f"\nTotal runtime: {total_time:.2f} seconds")
+
+    # Save runtime results
+    runtime_df.to_csv(SAVE_PATH / "runtime_python.csv", index=False)
+    print(f"\nResults saved to: {SAVE_PATH / 'runtime_python.csv'}")
+    if args.profile is not None:
+        print(f"Profiles saved to: {Path(args.profile) / backend}")
+
+    ############################################################################
+    #                    CROSS-PLATFORM COMPARISON
+    ############################################################################
+
+    print("\n" + "=" * 80)
+    print("CROSS-PLATFORM COMPARISON")
+    print("=" * 80 + "\n")
+
+    # Append this run to the results store; other platforms' CSVs are imported once
+    db = ResultsDB(SAVE_PATH / "benchmark_results.sqlite")
+    db.record(runtime_df, platform="Python", package="did_multiplegt_dyn",
+              package_version=package_version("py-did-multiplegt-dyn", "did_multiplegt_dyn"))
+    for file_name, platform in [("runtime_stata.csv", "Stata"),
+                                ("runtime_R_cran.csv", "R_CRAN"),
+                                ("runtime_R_polars.csv", "R_Polars")]:
+        if (SAVE_PATH / file_name).exists():
+            db.import_csv(SAVE_PATH / file_name, platform=platform, package="did_multiplegt_dyn")
+
+    pivot_df = db.pivot("runtime_sec")
+    if len(pivot_df.columns) > 3:
+        print("Runtime Comparison (seconds, latest run per platform):")
+        print(pivot_df.to_string(index=False))
+
+        # Calculate speedups
+        speedup = db.speedup("R_CRAN", "R_Polars")
+        if len(speedup):
+            print(f"\nR Polars vs R CRAN average speedup: {speedup['speedup'].mean():.2f}x")
+
+        pivot_df.to_csv(SAVE_PATH / "runtime_comparison_pivot.csv", index=False)
+        print(f"\nPivot table saved to: {SAVE_PATH / 'runtime_comparison_pivot.csv'}")
+    else:
+        print("No other platform results found for comparison.")
+        print("Run the Stata and R scripts first.")
+
+    # Runtime / peak memory regressions versus the previous run on this machine
+    regressions = db.check_regressions(platform="Python")
+    if len(regressions):
+        print("\nPERFORMANCE REGRESSIONS versus the previous run:")
+        print(regressions[["dataset", "spec", "metric", "previous", "latest", "ratio",
+                           "previous_version", "latest_version"]].to_string(index=False))
+    print(f"\nResults store: {db.path}")
+
+    print("\n" + "=" * 80)
+    print("ESTIMATION COMPLETE - Python Package")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
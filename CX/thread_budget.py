@@ -0,0 +1,126 @@
+"""
+File: thread_budget.py
+Purpose: Pin the thread budget of a benchmark run across polars, BLAS/OpenMP, numba and our own pools
+
+Every multi-threaded library sizes its pool once, from its own environment
+variable or from the CPU count, when it is first loaded: polars
+(POLARS_MAX_THREADS), OpenBLAS/MKL/BLIS/Accelerate and OpenMP code
+(*_NUM_THREADS), numba (NUMBA_NUM_THREADS) and numexpr. A budget therefore
+has to be in the environment of a fresh interpreter before any of them is
+imported, which is what bench_executor.run_isolated(threads=n) does: it
+starts a "spawn" child with thread_env(n) and the child restricts its CPU
+affinity to n cores (Linux) before running anything.
+
+The process pools and thread pools of this directory (spec_pool,
+mboot_engine, sim_panel) default to available_cpus(), which honours the same
+budget (BENCH_MAX_THREADS, then the CPU affinity), so they follow it too.
+
+thread_report() records what each library actually uses, so a budget that
+was not honoured shows up in the results instead of silently skewing them.
+
+Usage:
+    from bench_executor import run_isolated
+    res = run_isolated(fit, df, df_pl, 13, threads=4)
+    res["time"], res["threads"]          # {"cpus": 4, "polars": 4, "blas": 4, ...}
+
+    with thread_environ(2):                # for a subprocess started here
+        subprocess.run(["Rscript", ...])
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+# Variables read at load time by the libraries the benchmarks use
+THREAD_ENV_VARS = (
+    "BENCH_MAX_THREADS",       # our own pools, see available_cpus()
+    "POLARS_MAX_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMEXPR_MAX_THREADS",
+    "NUMBA_NUM_THREADS",
+    "RAYON_NUM_THREADS",
+)
+
+
+def thread_env(n_threads):
+    """Environment variables that cap every known pool at n_threads."""
+    return {var: str(int(n_threads)) for var in THREAD_ENV_VARS}
+
+
+@contextmanager
+def thread_environ(n_threads):
+    """Set thread_env(n_threads) in os.environ for the duration of the block."""
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update(thread_env(n_threads))
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def available_cpus():
+    """Thread budget of this process: BENCH_MAX_THREADS, else its CPU affinity, else the CPU count."""
+    budget = os.environ.get("BENCH_MAX_THREADS")
+    if budget:
+        return max(int(budget), 1)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pin_cpus(n_threads):
+    """
+    Restrict this process to the first n_threads CPUs it may run on.
+
+    Returns the CPUs kept, or None where affinity cannot be set (macOS,
+    Windows); the environment budget still applies there.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    cpus = sorted(os.sched_getaffinity(0))[:max(int(n_threads), 1)]
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError:
+        return None
+    return cpus
+
+
+def core_grid(max_threads=None):
+    """1, 2, 4, ... up to max_threads (default: available_cpus()), max_threads included."""
+    max_threads = max_threads or available_cpus()
+    grid = [1 << k for k in range(max_threads.bit_length()) if 1 << k <= max_threads]
+    return grid if grid[-1] == max_threads else grid + [max_threads]
+
+
+def thread_report():
+    """
+    Pool sizes in effect in this process.
+
+    Only libraries already imported are queried, so calling this after a
+    fit does not load anything new. BLAS pools are read through
+    threadpoolctl when it is installed.
+    """
+    report = {"cpus": available_cpus()}
+    if "polars" in sys.modules:
+        pl = sys.modules["polars"]
+        size = getattr(pl, "thread_pool_size", None) or getattr(pl, "threadpool_size", None)
+        report["polars"] = size() if size else None
+    if "numba" in sys.modules:
+        report["numba"] = sys.modules["numba"].get_num_threads()
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        return report
+    for pool in threadpool_info():
+        key = "openmp" if pool["user_api"] == "openmp" else "blas"
+        report[key] = max(report.get(key, 0), pool["num_threads"])
+    return report
@@ -0,0 +1,105 @@
+"""
+File: trials.py
+Purpose: Repeated-trial benchmark mode with warm-up, variance and confidence intervals
+
+A single cold run mixes import, JIT and first-touch costs with steady-state
+throughput. timed_trials() keeps the first call as its own cold-start metric;
+with warmup > 0 that cold call is the first of the `warmup` discarded calls
+(warmup - 1 more follow it). It then times `n_trials` calls and reports the
+median, IQR and a bootstrap confidence interval of the median runtime.
+
+With n_trials=1 and warmup=0 the record is exactly the old single cold run,
+so existing runtime CSVs stay comparable. With profile=<path>, the first
+timed run is sampled by sampling_profile.SamplingProfiler and its folded
+stacks are written to that path.
+
+Usage:
+    from trials import timed_trials
+    result, record, error = timed_trials(fit, n_trials=10, warmup=2, df=df)
+    record["Runtime_sec"], record["Runtime_CI_low"], record["Cold_sec"]
+"""
+
+import numpy as np
+
+from instrument import timed_call
+from sampling_profile import SamplingProfiler
+
+CI_LEVEL = 0.95
+N_BOOT = 2000
+
+
+def summarize_times(times, ci_level=CI_LEVEL, n_boot=N_BOOT, seed=0):
+    """
+    Median, IQR and percentile-bootstrap CI of the median of repeated runtimes.
+
+    Returns a dict with Runtime_sec (median), Runtime_mean, Runtime_sd,
+    Runtime_IQR, Runtime_CI_low, Runtime_CI_high and N_trials.
+    """
+    times = np.asarray(times, dtype=float)
+    q25, median, q75 = np.percentile(times, [25, 50, 75])
+    if len(times) > 1:
+        rng = np.random.default_rng(seed)
+        boot = np.median(rng.choice(times, size=(n_boot, len(times)), replace=True), axis=1)
+        alpha = (1 - ci_level) / 2
+        ci_low, ci_high = np.quantile(boot, [alpha, 1 - alpha])
+        sd = times.std(ddof=1)
+    else:
+        ci_low = ci_high = sd = np.nan
+    return {
+        "Runtime_sec": median,
+        "Runtime_mean": times.mean(),
+        "Runtime_sd": sd,
+        "Runtime_IQR": q75 - q25,
+        "Runtime_CI_low": ci_low,
+        "Runtime_CI_high": ci_high,
+        "N_trials": len(times),
+    }
+
+
+def _profiled_call(func, profile, **kwargs):
+    """timed_call() under a SamplingProfiler whose stacks are written to `profile`."""
+    with SamplingProfiler() as prof:
+        out = timed_call(func, **kwargs)
+    prof.write(profile)
+    return out
+
+
+def timed_trials(func, n_trials=1, warmup=0, profile=None, **kwargs):
+    """
+    `warmup` discarded runs, then `n_trials` timed runs of func(**kwargs).
+
+    The first (cold) run is timed as Cold_sec either way: it is the first of
+    the `warmup` discarded runs when warmup > 0 (warmup + n_trials calls in
+    all) and the first trial when warmup == 0, so the default (n_trials=1,
+    warmup=0) is a single call. Stops at the first error.
+    `profile` is an optional .folded output path for a sampling profile of
+    the first timed run.
+
+    Returns (result, record, error): the last result, a runtime record with
+    Cold_sec, median CPU_sec, max Peak_RSS_MB and the summarize_times()
+    statistics, and the error message or None.
+    """
+    def call(profiled):
+        if profiled and profile is not None:
+            return _profiled_call(func, profile, **kwargs)
+        return timed_call(func, **kwargs)
+
+    result, cold, error = call(warmup == 0)
+    runs = [cold] if warmup == 0 else []
+    for i in range(max(warmup - 1, 0) + n_trials - len(runs)):
+        if error is not None:
+            break
+        result, metrics, error = call(warmup > 0 and i == warmup - 1)
+        if i >= warmup - 1:
+            runs.append(metrics)
+
+    if not runs:
+        runs = [cold]
+    record = {
+        **summarize_times([r["Runtime_sec"] for r in runs]),
+        "CPU_sec": float(np.median([r["CPU_sec"] for r in runs])),
+        "Peak_RSS_MB": max(r["Peak_RSS_MB"] for r in runs),
+        "Cold_sec": cold["Runtime_sec"],
+        "Warmup": warmup,
+    }
+    return result, record, error
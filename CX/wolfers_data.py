@@ -0,0 +1,223 @@
+"""
+File: wolfers_data.py
+Purpose: Data construction for the Wolfers (2006) benchmark scenarios
+
+The 100x and 1000x scenarios replicate the original panel with new state IDs:
+replica i gets state + i * max(state), exactly as the original
+create_synthetic_data() did. Here each column is built with one np.tile /
+np.repeat allocation (or streamed in chunks of replicas), wrapped zero-copy
+as Arrow, and shared between pandas and polars without further copies. A
+scale can be written to disk once as an uncompressed Arrow file and
+memory-mapped by every estimator.
+
+prepare_data() builds the cohort / event-time columns shared by the
+Sun-Abraham (pyfixest), csdid and DidMultiplegtDyn setups with vectorized
+NumPy (pandas input) or expression (polars input) code.
+
+Usage:
+    from wolfers_data import prepare_data, get_scale, to_frames
+    wolfers = prepare_data(wolfers)
+    wolfers_1000x, wolfers_1000x_pl = to_frames(get_scale(wolfers, 1000, cache_dir=".columnar_cache"))
+    path = scale_path(wolfers, 1000, cache_dir=".columnar_cache")   # map it in a child
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# cohort_sa code for never-treated states (matching R)
+NEVER_TREATED_COHORT = 5000
+# event_time_binned is clipped to [-EVENT_TIME_BIN, EVENT_TIME_BIN] (matching R)
+EVENT_TIME_BIN = 13
+
+
+def prepare_data(df):
+    """
+    Prepare data matching R script specifications.
+
+    Casts state/year/cohort/udl to integers (missing cohort = 0, never
+    treated) and adds
+      - cohort_sa: cohort, or NEVER_TREATED_COHORT for never-treated states
+      - event_time_binned: year - cohort_sa + 1 clipped to
+        [-EVENT_TIME_BIN, EVENT_TIME_BIN], 0 for never-treated states
+
+    Accepts a pandas or polars DataFrame and returns the same type.
+    """
+    if not isinstance(df, pd.DataFrame):
+        return _prepare_data_pl(df)
+
+    df = df.copy()
+    df['state'] = df['state'].astype(int)
+    df['year'] = df['year'].astype(int)
+    df['cohort'] = df['cohort'].fillna(0).astype(int)
+    df['udl'] = df['udl'].astype(int)
+
+    cohort = df['cohort'].to_numpy()
+    never = cohort == 0
+    df['cohort_sa'] = np.where(never, NEVER_TREATED_COHORT, cohort)
+    rel_time = np.clip(df['year'].to_numpy() - df['cohort_sa'].to_numpy() + 1,
+                       -EVENT_TIME_BIN, EVENT_TIME_BIN)
+    df['event_time_binned'] = np.where(never, 0, rel_time)
+    return df
+
+
+def _prepare_data_pl(df):
+    import polars as pl
+
+    df = df.with_columns(
+        pl.col('state').cast(pl.Int64),
+        pl.col('year').cast(pl.Int64),
+        pl.col('cohort').cast(pl.Float64).fill_nan(None).fill_null(0).cast(pl.Int64),
+        pl.col('udl').cast(pl.Int64),
+    )
+    never = pl.col('cohort') == 0
+    return df.with_columns(
+        pl.when(never).then(NEVER_TREATED_COHORT).otherwise(pl.col('cohort')).alias('cohort_sa'),
+        pl.when(never).then(0)
+          .otherwise((pl.col('year') - pl.col('cohort') + 1).clip(-EVENT_TIME_BIN, EVENT_TIME_BIN))
+          .alias('event_time_binned'),
+    )
+
+
+def _event_time_binned_rowwise(df):
+    """Original row-wise implementation, kept as the reference for check_prepare_parity()."""
+    def calc_event_time_binned(row):
+        if row['cohort_sa'] == NEVER_TREATED_COHORT:
+            return 0
+        rel_time = row['year'] - row['cohort_sa'] + 1
+        if rel_time < -EVENT_TIME_BIN:
+            return -EVENT_TIME_BIN
+        elif rel_time > EVENT_TIME_BIN:
+            return EVENT_TIME_BIN
+        else:
+            return rel_time
+
+    return df.apply(calc_event_time_binned, axis=1)
+
+
+def check_prepare_parity(raw):
+    """
+    Check prepare_data() against the original df.apply(..., axis=1) version.
+
+    Compares cohort_sa and event_time_binned from the pandas and polars paths
+    with the row-wise reference; raises AssertionError on any mismatch.
+    """
+    import polars as pl
+
+    prepared = prepare_data(raw)
+    reference = _event_time_binned_rowwise(prepared)
+    assert (prepared['event_time_binned'].to_numpy() == reference.to_numpy()).all(), \
+        "event_time_binned differs from the row-wise reference"
+
+    prepared_pl = prepare_data(pl.from_pandas(raw))
+    for col in ['cohort_sa', 'event_time_binned']:
+        assert (prepared_pl[col].to_numpy() == prepared[col].to_numpy()).all(), \
+            f"polars {col} differs from pandas"
+    return True
+
+
+def _replica_arrays(df, start, stop, id_col="state"):
+    """Columns of replicas start..stop-1 as NumPy arrays (one allocation each)."""
+    n = len(df)
+    reps = stop - start
+    max_id = df[id_col].max()
+    arrays = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if col == id_col:
+            offsets = np.arange(start, stop, dtype=values.dtype) * max_id
+            arrays[col] = np.tile(values, reps) + np.repeat(offsets, n)
+        else:
+            arrays[col] = np.tile(values, reps)
+    return arrays
+
+
+def replicate_table(df, multiplier, id_col="state"):
+    """Replicate df `multiplier` times with new IDs, as an Arrow table."""
+    arrays = _replica_arrays(df, 0, multiplier, id_col)
+    return pa.table({col: pa.array(values) for col, values in arrays.items()})
+
+
+def iter_replica_batches(df, multiplier, id_col="state", reps_per_chunk=100):
+    """Stream the replicated panel as Arrow record batches of `reps_per_chunk` replicas."""
+    for start in range(0, multiplier, reps_per_chunk):
+        stop = min(start + reps_per_chunk, multiplier)
+        arrays = _replica_arrays(df, start, stop, id_col)
+        yield pa.record_batch([pa.array(v) for v in arrays.values()], names=list(arrays))
+
+
+def replicated_frames(df, multiplier, id_col="state"):
+    """
+    Build the replicated panel in memory as (pandas, polars) frames sharing buffers.
+
+    The pandas frame wraps the NumPy arrays directly (and is writable); the
+    polars frame is created from the same buffers through Arrow.
+    """
+    import polars as pl
+
+    arrays = _replica_arrays(df, 0, multiplier, id_col)
+    pandas_df = pd.DataFrame(arrays, copy=False)
+    polars_df = pl.from_arrow(pa.table({col: pa.array(v) for col, v in arrays.items()}))
+    return pandas_df, polars_df
+
+
+def write_scale(df, multiplier, path, id_col="state", reps_per_chunk=100):
+    """Write the replicated panel to an uncompressed Arrow file, chunk by chunk."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    writer = None
+    try:
+        for batch in iter_replica_batches(df, multiplier, id_col, reps_per_chunk):
+            if writer is None:
+                writer = ipc.new_file(str(tmp), batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return path
+
+
+def load_scale(path):
+    """Memory-map a scale written by write_scale() as an Arrow table."""
+    return ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def scale_path(df, multiplier, cache_dir, id_col="state"):
+    """
+    Path of the replicated panel's Arrow file, writing the file on first use.
+
+    The file name includes a hash of df's contents, so a change to the base
+    data (or its preparation) produces a new file instead of a stale one.
+    Passing the path rather than the frames to a child process lets the child
+    memory-map the panel instead of receiving a pickled copy.
+    """
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(",".join(map(str, df.columns)).encode())
+    path = Path(cache_dir) / f"wolfers_{multiplier}x_{h.hexdigest()[:16]}.arrow"
+    if not path.exists():
+        write_scale(df, multiplier, path, id_col)
+    return path
+
+
+def get_scale(df, multiplier, cache_dir, id_col="state"):
+    """Return the replicated panel as a memory-mapped Arrow table, writing it on first use."""
+    return load_scale(scale_path(df, multiplier, cache_dir, id_col))
+
+
+def to_frames(table):
+    """
+    (pandas, polars) views of an Arrow table without copying numeric columns.
+
+    Numeric columns of the pandas frame are read-only when the table is
+    memory-mapped.
+    """
+    import polars as pl
+
+    return table.to_pandas(split_blocks=True), pl.from_arrow(table)